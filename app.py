@@ -1,23 +1,28 @@
 import streamlit as st
 import pandas as pd
-import json
 import os
-import plotly.express as px
-from datetime import datetime, date
-from dateutil.relativedelta import relativedelta
+from datetime import datetime
 from streamlit_option_menu import option_menu
 import time
+from finsaas import archive, export, extrato, finance, importer, instrument, invoices, recurrence, storage
+from finsaas.cache import FrameCache
+from finsaas.writer import CommitQueue
+from finsaas.constants import CATEGORY_COLORS
+from finsaas.utils import safe_float
 
 # --- 1. CONFIGURAÇÃO INICIAL ---
 st.set_page_config(page_title="FinanSaas", page_icon="💎", layout="wide")
 
-# --- 2. DEFINIÇÃO DE CORES DAS CATEGORIAS ---
-CATEGORY_COLORS = {
-    "Alimentação": "#FF9F43", "Moradia": "#54A0FF", "Transporte": "#F368E0",
-    "Lazer": "#00D2D3", "Saúde": "#FF6B6B", "Educação": "#5F27CD",
-    "Salário": "#1DD1A1", "Investimento": "#222F3E", "Assinaturas": "#8395A7",
-    "Compras": "#FF9FF3", "Outros": "#C8D6E5"
-}
+# --- INSTRUMENTAÇÃO (FINSAAS_TRACE_LOG grava JSON lines; FINSAAS_ADMINS vê o painel) ---
+is_admin = st.session_state.get('user_email') in instrument.ADMINS
+instrument.begin_rerun(st.session_state, bool(instrument.TRACE_LOG) or is_admin,
+                       user=st.session_state.get('user_email'))
+if st.session_state.get('_profiler') is not None:
+    # Rerun anterior interrompido (st.rerun) no meio da captura
+    st.session_state['_profile_result'] = st.session_state.pop('_profiler').stop()
+if st.session_state.pop('_profile_next', False):
+    try: st.session_state['_profiler'] = instrument.Profiler().start()
+    except instrument.ProfilerBusy: st.session_state['_profile_busy'] = True
 
 # --- CSS PERSONALIZADO ---
 def inject_custom_css():
@@ -59,64 +64,125 @@ def inject_custom_css():
 
 inject_custom_css()
 
-# --- FUNÇÕES UTILITÁRIAS ---
-def safe_float(val):
-    if val is None: return 0.0
-    try: return float(val)
-    except (ValueError, TypeError): return 0.0
-
 # --- GESTÃO DE DADOS ---
-DB_FILE = 'finsaas_secure_db.json'
-
+# SQLite (WAL) em finsaas/storage.py; o JSON antigo é migrado na primeira execução
+@st.cache_resource
 def init_db():
-    if not os.path.exists(DB_FILE):
-        db_structure = { "users": {}, "data": {} }
-        with open(DB_FILE, 'w') as f: json.dump(db_structure, f)
+    storage.init_db()
 
-def load_full_db():
-    init_db()
-    try:
-        with open(DB_FILE, 'r') as f: return json.load(f)
-    except:
-        return {"users": {}, "data": {}}
+init_db()
 
-def save_full_db(data):
-    with open(DB_FILE, 'w') as f: json.dump(data, f, indent=4)
+# --- CACHE ENTRE RERUNS (compartilhado pelas sessões) ---
+@st.cache_resource
+def get_frame_cache():
+    return FrameCache(max_bytes=int(os.environ.get('FINSAAS_CACHE_MB', 256)) * 1024 * 1024)
+
+frame_cache = get_frame_cache()
+
+# --- GRAVAÇÃO (fila única, agrupa commits de sessões concorrentes) ---
+@st.cache_resource
+def get_writer():
+    return CommitQueue()
+
+def commit(op, *args, expected_version=None, **kwargs):
+    try:
+        with instrument.span("writer.commit", op=op.__name__):
+            get_writer().call(op, st.session_state['user_email'], *args, expected_version=expected_version, **kwargs)
+        return True
+    except storage.ConflictError:
+        st.error("Seus dados foram alterados em outra sessão. Recarregue a página e refaça a alteração.")
+        return False
+
+def shown_version(key, current):
+    # Versão com que o editor 'key' foi mostrado no rerun anterior (a que o usuário editou). O clique
+    # em Salvar chega no rerun seguinte, que já relê a versão e pode incluir escritas de outra sessão
+    shown = st.session_state.get(key, current)
+    st.session_state[key] = current
+    return shown
+
+# --- COMPONENTES INSTRUMENTADOS ---
+def data_editor(df, **kwargs):
+    instrument.record_payload("data_editor", df)
+    with instrument.span("st.data_editor", rows=len(df)):
+        return st.data_editor(df, **kwargs)
+
+def plotly_chart(fig):
+    instrument.record_payload("plotly_chart", fig)
+    with instrument.span("st.plotly_chart"):
+        st.plotly_chart(fig, use_container_width=True)
 
 # --- AUTENTICAÇÃO ---
 if 'user_email' not in st.session_state: st.session_state['user_email'] = None
 if 'user_name' not in st.session_state: st.session_state['user_name'] = None
 
 def login_user(email, password):
-    db = load_full_db()
-    user = db['users'].get(email)
-    if user and user['password'] == password:
+    user = storage.authenticate(email, password)
+    if user:
         st.session_state['user_email'] = email
         st.session_state['user_name'] = user['name']
         return True
     return False
 
 def register_user(name, email, password):
-    db = load_full_db()
-    if email in db['users']: return False 
-    
-    db['users'][email] = {"name": name, "password": password}
-    db['data'][email] = {
-        "transactions": [], "cards": [], "accounts": ["Carteira"], "goals": []
-    }
-    save_full_db(db)
-    return True
-
-def get_user_data():
+    return storage.create_user(email, name, password)
+
+def load_prepared(email, version, from_year=None):
+    # Dados do usuário + df_full da versão atual; qualquer gravação muda a versão.
+    # Só a partição quente (transações no formato compacto, columnar.TxStore) mais o saldo dos
+    # anos arquivados; from_year traz também os anos arquivados a partir dele.
+    def compute():
+        user_db = archive.load_user_data(email, from_year)
+        return user_db, finance.prepare_transactions(user_db)
+    key = (email, version) if from_year is None else (email, version, 'arquivo', from_year)
+    return frame_cache.get_or_compute(key, compute)
+
+def get_user_data(version=None):
     email = st.session_state['user_email']
-    db = load_full_db()
-    return db['data'].get(email, {"transactions": [], "cards": [], "accounts": [], "goals": []})
+    if version is None: version = storage.get_version(email)
+    user_db, _ = load_prepared(email, version)
+    # Cópia rasa: as páginas alteram as listas antes de gravar (o TxStore e o saldo arquivado não mudam)
+    return {k: list(v) if isinstance(v, list) else v for k, v in user_db.items()}
 
-def save_user_data(user_data):
+def get_month_data(version, selected_date):
     email = st.session_state['user_email']
-    db = load_full_db()
-    db['data'][email] = user_data
-    save_full_db(db)
+    cutoff = storage.archive_cutoff(email)
+    from_year = archive.first_year(selected_date)
+    user_db, df = load_prepared(email, version, from_year if cutoff is not None and from_year < cutoff else None)
+    y, m = selected_date.year, selected_date.month
+    # Saldo inicial e cards do Dashboard vêm do índice mensal (sem varrer o histórico);
+    # recorrências são expandidas só para este mês e somadas por cima
+    def compute():
+        df_view, saldo, totals = finance.month_view(df, selected_date), storage.opening_balance(email, y, m), storage.month_totals(email, y, m)
+        if user_db.get('recurrences'):
+            occ, occ_saldo = recurrence.month(user_db, selected_date)
+            df_view, saldo = finance.concat_view(df_view, occ), saldo + occ_saldo
+            totals = {**totals, 'rec': totals['rec'] + occ.loc[occ['type'] == 'Receita', 'amount'].sum(),
+                      'desp': totals['desp'] + occ.loc[occ['type'] == 'Despesa', 'amount'].sum()}
+        return df_view, saldo, totals
+    df_view, saldo, totals = frame_cache.get_or_compute((email, version, y, m), compute)
+    return df, df_view, saldo, totals
+
+def get_trend_data(version, first, last):
+    # O resumo fica em cache por mês de competência (uma tabela por versão, que só cresce): trocar de
+    # mês ou de intervalo só calcula, num só agrupamento, os meses que ainda não estão nela
+    email = st.session_state['user_email']
+    cutoff = storage.archive_cutoff(email)
+    from_year = archive.first_year(first.start_time)
+    from_year = from_year if cutoff is not None and from_year < cutoff else None
+    user_db, df = load_prepared(email, version, from_year)
+    key = (email, version, 'tendencia', from_year)
+    months = finance.month_range(first, last).astype(str)
+    cached = frame_cache.get(key)
+    missing = months if cached is None else months[~months.isin(cached.index)]
+    if len(missing):
+        fresh = finance.cash_flow(user_db, df, finance.month_range(missing[0], missing[-1])).set_index('mes', drop=False)
+        cached = frame_cache.put(key, fresh if cached is None else pd.concat([cached, fresh[~fresh.index.isin(cached.index)]]))
+    return cached.loc[months].reset_index(drop=True)
+
+def drop_export():
+    # Apaga o arquivo temporário da última exportação desta sessão
+    pronto = st.session_state.pop('_export', None)
+    if pronto and os.path.exists(pronto['path']): os.remove(pronto['path'])
 
 # --- TELA DE LOGIN ---
 if not st.session_state['user_email']:
@@ -149,46 +215,10 @@ if not st.session_state['user_email']:
     st.stop() 
 
 # --- APLICAÇÃO ---
-db_data = get_user_data()
+data_version = storage.get_version(st.session_state['user_email'])
+db_data = get_user_data(data_version)
 user_name = st.session_state['user_name']
 
-def process_data(user_db, selected_date):
-    txs = user_db.get('transactions', [])
-    cards_list = user_db.get('cards', [])
-    cards = {c['name']: c for c in cards_list}
-    cols = ['id', 'date', 'type', 'amount', 'account', 'category', 'status', 'desc', 'competencia', 'comp_mes', 'comp_ano']
-    
-    if not txs: return pd.DataFrame(columns=cols), pd.DataFrame(columns=cols), 0.0
-
-    df = pd.DataFrame(txs)
-    if 'date' not in df.columns or 'amount' not in df.columns:
-        return pd.DataFrame(columns=cols), pd.DataFrame(columns=cols), 0.0
-
-    df['date'] = pd.to_datetime(df['date'])
-    df['amount'] = df['amount'].apply(safe_float)
-    
-    def get_competence(row):
-        if row.get('account') in cards and row.get('type') == 'Despesa':
-            try:
-                closing = safe_float(cards[row['account']]['closing_day'])
-                if row['date'].day >= closing:
-                    return row['date'] + relativedelta(months=1)
-            except: pass
-        return row['date']
-
-    df['competencia'] = df.apply(get_competence, axis=1)
-    df['comp_mes'] = df['competencia'].dt.month
-    df['comp_ano'] = df['competencia'].dt.year
-
-    df_view = df[(df['comp_mes'] == selected_date.month) & (df['comp_ano'] == selected_date.year)]
-    mask_ant = df['competencia'] < datetime(selected_date.year, selected_date.month, 1)
-    df_ant = df[mask_ant]
-    
-    rec = df_ant[(df_ant['type'] == 'Receita') & (df_ant['status'] == 'Pago')]['amount'].sum()
-    desp = df_ant[(df_ant['type'] == 'Despesa') & (df_ant['status'] == 'Pago')]['amount'].sum()
-    
-    return df, df_view, (rec - desp)
-
 # --- SIDEBAR ---
 with st.sidebar:
     st.markdown(f"### Olá, {user_name} 👋")
@@ -201,8 +231,8 @@ with st.sidebar:
     st.caption("FinanSaas v1.4 (Stable)")
     selected = option_menu(
         menu_title=None,
-        options=["Dashboard", "Extrato", "Cadastros", "Metas", "Nova Transação"],
-        icons=["grid", "table", "wallet", "trophy", "plus-circle"],
+        options=["Dashboard", "Tendência", "Extrato", "Cadastros", "Metas", "Nova Transação"],
+        icons=["grid", "graph-up", "table", "wallet", "trophy", "plus-circle"],
         default_index=0,
     )
     st.markdown("---")
@@ -210,15 +240,14 @@ with st.sidebar:
         st.session_state['user_email'] = None
         st.rerun()
 
-df_full, df_view, saldo_inicial = process_data(db_data, ref_date)
+df_full, df_view, saldo_inicial, month_totals = get_month_data(data_version, ref_date)
 
 # --- PÁGINAS ---
+page_span = instrument.span(f"page.{selected}").start()
 if selected == "Dashboard":
-    if not df_view.empty:
-        rec = df_view[df_view['type']=='Receita']['amount'].sum()
-        desp = df_view[df_view['type']=='Despesa']['amount'].sum()
-        saldo_mes = rec - desp
-    else: rec = 0.0; desp = 0.0; saldo_mes = 0.0
+    import plotly.express as px  # só as páginas com gráfico pagam o import do plotly
+    rec = month_totals['rec']; desp = month_totals['desp']
+    saldo_mes = rec - desp
 
     c1, c2, c3 = st.columns(3)
     c1.markdown(f'<div class="color-card bg-green"><div><div class="lbl-small">Receitas</div><div class="val-big">R$ {rec:,.2f}</div></div><div class="cc-icon">↑</div></div>', unsafe_allow_html=True)
@@ -231,11 +260,12 @@ if selected == "Dashboard":
         if not df_view.empty:
             daily = df_view.groupby('date')['amount'].sum().reset_index()
             # MELHORIA NO DASHBOARD: Cores nas barras também
-            fig = px.bar(daily, x='date', y='amount', 
-                         title="",
-                         color_discrete_sequence=['#2D9CDB'])
-            fig.update_layout(height=250, margin=dict(l=0,r=0,t=0,b=0), paper_bgcolor='white', plot_bgcolor='white')
-            st.plotly_chart(fig, use_container_width=True)
+            with instrument.span("plotly.bar"):
+                fig = px.bar(daily, x='date', y='amount', 
+                             title="",
+                             color_discrete_sequence=['#2D9CDB'])
+                fig.update_layout(height=250, margin=dict(l=0,r=0,t=0,b=0), paper_bgcolor='white', plot_bgcolor='white')
+            plotly_chart(fig)
         else: st.info("Sem dados.")
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -245,30 +275,133 @@ if selected == "Dashboard":
             df_pie = df_view[df_view['type']=='Despesa']
             if not df_pie.empty:
                 # MELHORIA NO DASHBOARD: Cores fixas e Legenda Ativa
-                fig = px.pie(df_pie, values='amount', names='category', hole=0.6, 
-                             color='category', color_discrete_map=CATEGORY_COLORS)
-                # Ativa a legenda (showlegend=True) para clareza
-                fig.update_layout(height=250, showlegend=True, margin=dict(l=0,r=0,t=0,b=0), legend=dict(orientation="h", yanchor="bottom", y=-0.2))
-                st.plotly_chart(fig, use_container_width=True)
+                with instrument.span("plotly.pie"):
+                    fig = px.pie(df_pie, values='amount', names='category', hole=0.6, 
+                                 color='category', color_discrete_map=CATEGORY_COLORS)
+                    # Ativa a legenda (showlegend=True) para clareza
+                    fig.update_layout(height=250, showlegend=True, margin=dict(l=0,r=0,t=0,b=0), legend=dict(orientation="h", yanchor="bottom", y=-0.2))
+                plotly_chart(fig)
             else: st.info("Sem despesas.")
         else: st.info("Sem dados.")
         st.markdown('</div>', unsafe_allow_html=True)
 
+    if db_data.get('cards'):
+        # Faturas e limite vêm dos totais por (cartão, competência), mantidos a cada gravação, mais as recorrências no cartão
+        st.markdown('<div class="white-card"><h5>Cartões</h5>', unsafe_allow_html=True)
+        comp = f"{ref_date.year:04d}-{ref_date.month:02d}"
+        cols = st.columns(min(len(db_data['cards']), 3))
+        for i, stmt in enumerate(invoices.statements(st.session_state['user_email'], db_data, comps=[comp])):
+            with cols[i % len(cols)]:
+                fatura = invoices.invoice_for(stmt, comp)
+                card = db_data['cards'][i]
+                st.markdown(f"**💳 {stmt['name']}**")
+                st.metric(f"Fatura {meses[ref_date.month]}/{ref_date.year}", f"R$ {fatura['total'] if fatura else 0.0:,.2f}",
+                          help=f"Fecha em {invoices.closing_date(card, comp):%d/%m/%Y} · vence em {invoices.due_date(card, comp):%d/%m/%Y}")
+                st.caption(invoices.status(card, comp, datetime.now().date()))
+                if stmt['utilization'] is not None:
+                    st.progress(min(max(stmt['utilization'], 0.0), 1.0))
+                    st.caption(f"Disponível: R$ {stmt['available']:,.2f} de R$ {stmt['limit']:,.2f}")
+                abertas = [f for f in stmt['invoices'] if f['status'] != "Vencida" and f['total']]
+                if abertas:
+                    st.dataframe(pd.DataFrame([{"Competência": f['comp'], "Vencimento": f['due'], "Situação": f['status'],
+                                                "Valor": f['total']} for f in abertas]),
+                                 hide_index=True, use_container_width=True,
+                                 column_config={"Vencimento": st.column_config.DateColumn(format="DD/MM/YYYY"),
+                                                "Valor": st.column_config.NumberColumn(format="R$ %.2f")})
+        st.markdown('</div>', unsafe_allow_html=True)
+
+elif selected == "Tendência":
+    import plotly.express as px
+    st.markdown("### 📈 Tendência e Projeção")
+    t1, t2 = st.columns(2)
+    meses_antes = t1.slider("Meses anteriores", 0, 23, 11)
+    meses_depois = t2.slider("Meses à frente", 0, 12, 6)
+    ref = pd.Period(ref_date, 'M')
+    trend = get_trend_data(data_version, ref - meses_antes, ref + meses_depois)
+
+    st.markdown('<div class="white-card"><h5>Receitas e Despesas por Mês</h5>', unsafe_allow_html=True)
+    bars = trend.melt(id_vars='mes', value_vars=['receitas', 'despesas', 'despesas_pendentes'], var_name='serie', value_name='valor')
+    with instrument.span("plotly.bar"):
+        fig = px.bar(bars, x='mes', y='valor', color='serie', barmode='group',
+                     color_discrete_map={'receitas': '#27AE60', 'despesas': '#EB5757', 'despesas_pendentes': '#F2994A'})
+        fig.update_layout(height=300, margin=dict(l=0,r=0,t=0,b=0), paper_bgcolor='white', plot_bgcolor='white', legend_title_text='')
+    plotly_chart(fig)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    st.markdown('<div class="white-card"><h5>Saldo Acumulado</h5>', unsafe_allow_html=True)
+    # Realizado: só o que foi pago; projetado: pendências pagas no mês; livre: projetado menos o que falta para as metas
+    linhas = ['saldo_final', 'saldo_projetado'] + (['saldo_livre'] if trend['reserva_metas'].iat[0] else [])
+    with instrument.span("plotly.line"):
+        fig = px.line(trend, x='mes', y=linhas, markers=True,
+                      color_discrete_map={'saldo_final': '#2D9CDB', 'saldo_projetado': '#9B51E0', 'saldo_livre': '#27AE60'})
+        fig.update_layout(height=300, margin=dict(l=0,r=0,t=0,b=0), paper_bgcolor='white', plot_bgcolor='white', legend_title_text='')
+    plotly_chart(fig)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    st.dataframe(trend, hide_index=True, use_container_width=True,
+                 column_config={c: st.column_config.NumberColumn(format="R$ %.2f") for c in trend.columns if c != 'mes'})
+
 elif selected == "Extrato":
     st.markdown("### 📝 Extrato")
-    if df_full.empty:
+    contas = db_data.get('accounts', []) + [c['name'] for c in db_data.get('cards', [])]
+    cats = list(CATEGORY_COLORS.keys())
+
+    # Filtros e paginação no servidor: só a janela visível vai para o navegador
+    f1, f2, f3, f4 = st.columns([2, 2, 2, 1])
+    periodo = f1.date_input("Período", value=(), format="DD/MM/YYYY")
+    f_contas = f2.multiselect("Conta", contas)
+    f_cats = f3.multiselect("Categoria", cats)
+    f_status = f4.multiselect("Status", ["Pago", "Pendente"])
+    filtros = dict(start=periodo[0] if len(periodo) > 0 else None, end=periodo[1] if len(periodo) > 1 else None,
+                   accounts=f_contas, categories=f_cats, statuses=f_status)
+
+    email = st.session_state['user_email']
+    total = storage.count_transactions(email, **filtros)
+    p1, p2, p3 = st.columns([1, 1, 4])
+    por_pagina = p1.selectbox("Linhas por página", [50, 100, 250, 500], index=1)
+    n_paginas = max(1, -(-total // por_pagina))
+    pagina = p2.number_input("Página", min_value=1, max_value=n_paginas, value=1)
+    p3.caption(f"{total} transações · página {pagina} de {n_paginas}")
+
+    with st.expander("📤 Exportar"):
+        # Gravado em blocos num arquivo temporário (finsaas/export.py): o histórico não passa pela sessão
+        e1, e2 = st.columns([1, 3])
+        fmt = e1.selectbox("Formato", list(export.MIME_TYPES), format_func=str.upper)
+        e2.caption("Exporta todas as transações dos filtros acima (inclusive anos arquivados e ocorrências das recorrências), com a competência.")
+        # O arquivo gerado vale só para estes filtros e formato; mudou um deles, é descartado
+        chave = (fmt, repr(sorted(filtros.items())))
+        # Arquivos de sessões que terminaram sem baixar são apagados depois de export.TEMP_TTL_S
+        export.sweep_temp_files()
+        pronto = st.session_state.get('_export')
+        if pronto and (pronto['chave'] != chave or not os.path.exists(pronto['path'])):
+            drop_export()
+            pronto = None
+        novo = st.button("Gerar arquivo")
+        if novo:
+            drop_export()
+            path = export.temp_path(fmt)
+            with st.spinner("Exportando..."):
+                n = export.export_transactions(email, path, fmt, **filtros)
+            pronto = st.session_state['_export'] = {'chave': chave, 'path': path, 'fmt': fmt, 'rows': n}
+        if pronto:
+            # O download_button lê o arquivo inteiro para a memória do servidor: ele só é montado no rerun
+            # em que o arquivo ficou pronto (ou quando pedido de novo), e não a cada rerun
+            if novo or st.button(f"Baixar arquivo pronto ({pronto['rows']} transações, {pronto['fmt'].upper()})"):
+                with open(pronto['path'], 'rb') as f:
+                    # Baixou: o arquivo temporário é apagado no callback
+                    st.download_button(f"Baixar {pronto['rows']} transações ({pronto['fmt'].upper()})", f,
+                                       file_name=f"extrato.{pronto['fmt']}", mime=export.MIME_TYPES[pronto['fmt']], on_click=drop_export)
+
+    if total == 0:
         st.warning("Sem transações.")
     else:
-        df_edit = df_full.sort_values('date', ascending=False).copy()
-        df_edit['Excluir'] = False
-        contas = db_data.get('accounts', []) + [c['name'] for c in db_data.get('cards', [])]
-        cats = list(CATEGORY_COLORS.keys())
-
-        edited = st.data_editor(
-            df_edit,
+        versao_extrato = shown_version('_v_extrato', data_version)
+        window = extrato.editor_frame(storage.query_transactions(email, limit=por_pagina, offset=(pagina - 1) * por_pagina, **filtros))
+        edited = data_editor(
+            window,
             column_config={
                 "Excluir": st.column_config.CheckboxColumn(default=False),
-                "id": None, "competencia": None, "comp_mes": None, "comp_ano": None,
+                "id": None,
                 "date": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
                 "amount": st.column_config.NumberColumn("Valor", format="R$ %.2f"),
                 "type": st.column_config.SelectboxColumn("Tipo", options=["Receita", "Despesa"]),
@@ -279,12 +412,28 @@ elif selected == "Extrato":
             hide_index=True, use_container_width=True, num_rows="dynamic"
         )
         if st.button("Salvar Extrato"):
-            final = edited[edited['Excluir']==False].drop(columns=['Excluir', 'competencia', 'comp_mes', 'comp_ano'], errors='ignore')
-            final['date'] = final['date'].apply(lambda x: x.strftime('%Y-%m-%d') if isinstance(x, (datetime, date)) else x)
-            db_data['transactions'] = final.to_dict(orient='records')
-            save_user_data(db_data)
-            st.success("Salvo!")
-            st.rerun()
+            inserted, updated, deleted = extrato.diff_window(window, edited)
+            changed = inserted or updated or deleted
+            if not changed or commit(storage.apply_transaction_changes, inserted, updated, deleted, expected_version=versao_extrato):
+                st.success("Salvo!")
+                st.rerun()
+
+    # Anos arquivados só são lidos quando o filtro de período chega neles
+    cutoff = storage.archive_cutoff(email)
+    if cutoff is not None and filtros['start'] is not None and filtros['start'].year < cutoff:
+        total_arq = archive.count_transactions(email, **filtros)
+        a1, a2 = st.columns([1, 5])
+        n_pag_arq = max(1, -(-total_arq // por_pagina))
+        pag_arq = a1.number_input("Página (arquivo)", min_value=1, max_value=n_pag_arq, value=1)
+        a2.caption(f"{total_arq} transações de anos arquivados (somente leitura) · página {pag_arq} de {n_pag_arq}")
+        # Mesma janela do Extrato: só uma página das linhas arquivadas vai para o navegador
+        arquivadas = archive.query_transactions(email, limit=por_pagina, offset=(pag_arq - 1) * por_pagina, **filtros) if total_arq else []
+        if arquivadas:
+            arq_df = extrato.editor_frame(arquivadas).drop(columns=['Excluir'])
+            instrument.record_payload("dataframe", arq_df)
+            st.dataframe(arq_df, column_config={"id": None, "date": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                                                "amount": st.column_config.NumberColumn("Valor", format="R$ %.2f")},
+                         hide_index=True, use_container_width=True)
 
 elif selected == "Cadastros":
     st.markdown("### ⚙️ Cadastros")
@@ -294,24 +443,26 @@ elif selected == "Cadastros":
         if cdf.empty: cdf = pd.DataFrame(columns=["name", "limit", "closing_day", "due_day"])
         if 'limit' in cdf.columns: cdf['limit'] = cdf['limit'].apply(safe_float)
         cdf['Excluir'] = False
-        ed_cards = st.data_editor(cdf, num_rows="dynamic", use_container_width=True, hide_index=True, column_config={"Excluir": st.column_config.CheckboxColumn(default=False)})
+        versao_cartoes = shown_version('_v_cartoes', data_version)
+        ed_cards = data_editor(cdf, num_rows="dynamic", use_container_width=True, hide_index=True, column_config={"Excluir": st.column_config.CheckboxColumn(default=False)})
         if st.button("Salvar Cartões"):
             new_c = ed_cards[ed_cards['Excluir']==False].drop(columns=['Excluir'])
             db_data['cards'] = new_c.to_dict(orient='records')
-            save_user_data(db_data)
-            st.success("Atualizado!")
-            st.rerun()
+            if commit(storage.save_cards, db_data['cards'], expected_version=versao_cartoes):
+                st.success("Atualizado!")
+                st.rerun()
 
     with tab2:
         adf = pd.DataFrame({"Nome": db_data.get('accounts', ["Carteira"])})
         adf['Excluir'] = False
-        ed_acc = st.data_editor(adf, num_rows="dynamic", use_container_width=True, hide_index=True, column_config={"Excluir": st.column_config.CheckboxColumn(default=False)})
+        versao_contas = shown_version('_v_contas', data_version)
+        ed_acc = data_editor(adf, num_rows="dynamic", use_container_width=True, hide_index=True, column_config={"Excluir": st.column_config.CheckboxColumn(default=False)})
         if st.button("Salvar Contas"):
             valid = ed_acc[ed_acc['Excluir']==False]['Nome'].tolist()
             db_data['accounts'] = [x for x in valid if str(x).strip()]
-            save_user_data(db_data)
-            st.success("Atualizado!")
-            st.rerun()
+            if commit(storage.save_accounts, db_data['accounts'], expected_version=versao_contas):
+                st.success("Atualizado!")
+                st.rerun()
 
 elif selected == "Metas":
     st.markdown("### 🎯 Metas")
@@ -328,6 +479,7 @@ elif selected == "Metas":
         gdf['color'] = gdf['color'].fillna("#2D9CDB")
 
     gdf['Excluir'] = False
+    versao_metas = shown_version('_v_metas', data_version)
 
     # --- CORREÇÃO BLINDADA: SELETOR DE CORES OU TEXTO ---
     # Isso evita o AttributeError se a versão for velha
@@ -337,7 +489,7 @@ elif selected == "Metas":
         # Fallback para servidores antigos
         color_config = st.column_config.TextColumn("Cor (Hex)", help="Ex: #FF0000", validate="^#[0-9a-fA-F]{6}$")
 
-    edited_goals = st.data_editor(
+    edited_goals = data_editor(
         gdf,
         column_config={
             "Excluir": st.column_config.CheckboxColumn(help="Remover meta", default=False),
@@ -352,9 +504,9 @@ elif selected == "Metas":
     if st.button("💾 Salvar Metas"):
         valid_goals = edited_goals[edited_goals['Excluir'] == False].drop(columns=['Excluir'])
         db_data['goals'] = valid_goals.to_dict(orient='records')
-        save_user_data(db_data)
-        st.success("Metas atualizadas!")
-        st.rerun()
+        if commit(storage.save_goals, db_data['goals'], expected_version=versao_metas):
+            st.success("Metas atualizadas!")
+            st.rerun()
 
     if db_data.get('goals'):
         st.markdown("---")
@@ -380,7 +532,7 @@ elif selected == "Metas":
 elif selected == "Nova Transação":
     st.markdown("### ➕ Nova Transação")
     st.markdown('<div class="white-card">', unsafe_allow_html=True)
-    tab_tx, tab_meta = st.tabs(["Movimentação Comum", "Enviar para Meta 🎯"])
+    tab_tx, tab_rec, tab_meta, tab_imp = st.tabs(["Movimentação Comum", "Recorrente / Parcelado 🔁", "Enviar para Meta 🎯", "Importar Extrato 📥"])
     
     with tab_tx:
         with st.form("nt"):
@@ -396,10 +548,65 @@ elif selected == "Nova Transação":
             desc = st.text_input("Descrição")
             if st.form_submit_button("Salvar Movimentação"):
                 nt = {"id": int(datetime.now().timestamp()), "date": dt.strftime("%Y-%m-%d"), "type": tipo, "amount": val, "account": acc, "category": cat, "status": stt, "desc": desc}
-                db_data['transactions'].append(nt)
-                save_user_data(db_data)
+                commit(storage.insert_transaction, nt)
                 st.success("Salvo!")
 
+    with tab_rec:
+        # Uma regra só por série; as ocorrências aparecem no Dashboard sem virar linhas no banco
+        contas = db_data.get('accounts', []) + [c['name'] for c in db_data.get('cards', [])]
+        with st.form("rec_tx"):
+            c_r1, c_r2, c_r3 = st.columns(3)
+            tipo_r = c_r1.selectbox("Tipo", ["Despesa", "Receita"])
+            val_r = c_r2.number_input("Valor de cada ocorrência", min_value=0.0, step=10.0)
+            freq_r = c_r3.selectbox("Frequência", list(recurrence.FREQS), format_func=recurrence.FREQS.get)
+            c_r4, c_r5, c_r6 = st.columns(3)
+            inicio_r = c_r4.date_input("Primeira ocorrência", datetime.now())
+            fim_r = c_r5.radio("Término", ["Sem fim", "Data final", "Nº de parcelas"])
+            ate_r = c_r6.date_input("Data final", datetime.now())
+            parcelas_r = c_r6.number_input("Nº de parcelas", min_value=1, value=12, step=1)
+            c_r7, c_r8 = st.columns(2)
+            acc_r = c_r7.selectbox("Conta", contas)
+            cat_r = c_r8.selectbox("Categoria", list(CATEGORY_COLORS.keys()), index=list(CATEGORY_COLORS).index("Assinaturas"))
+            stt_r = st.radio("Status", ["Pago", "Pendente"], horizontal=True, key="stt_rec")
+            desc_r = st.text_input("Descrição", key="desc_rec")
+            if st.form_submit_button("Salvar Recorrência"):
+                rule = {"id": None, "start": inicio_r.strftime("%Y-%m-%d"), "freq": freq_r,
+                        "until": ate_r.strftime("%Y-%m-%d") if fim_r == "Data final" else None,
+                        "count": int(parcelas_r) if fim_r == "Nº de parcelas" else None,
+                        "type": tipo_r, "amount": val_r, "account": acc_r, "category": cat_r, "status": stt_r, "desc": desc_r}
+                if commit(storage.save_recurrence, rule):
+                    st.success("Recorrência salva!")
+                    st.rerun()
+
+        versao_recorrencias = shown_version('_v_recorrencias', data_version)
+        for rule in db_data.get('recurrences', []):
+            fim = f"{int(rule['count'])} parcelas" if rule.get('count') else (f"até {rule['until']}" if rule.get('until') else "sem fim")
+            with st.expander(f"🔁 {rule.get('desc') or rule.get('category')} · R$ {safe_float(rule.get('amount')):,.2f} · "
+                             f"{recurrence.FREQS.get(rule['freq'], rule['freq'])} desde {rule['start']} · {fim}"):
+                # Só as próximas ocorrências são expandidas para edição
+                hoje = pd.Period(datetime.now(), 'M')
+                proximas = recurrence.expand({**db_data, 'recurrences': [rule]}, hoje - 1, hoje + 12)
+                if proximas.empty: st.caption("Sem ocorrências nos próximos meses.")
+                else:
+                    ocorr = st.selectbox("Ocorrência", proximas.index, key=f"occ_sel_{rule['id']}",
+                                         format_func=lambda i: f"{proximas.at[i, 'date']:%d/%m/%Y} · {proximas.at[i, 'desc']} · R$ {proximas.at[i, 'amount']:,.2f}")
+                    n = int(proximas.at[ocorr, 'n'])
+                    with st.form(f"occ_{rule['id']}_{n}"):
+                        c_o1, c_o2, c_o3 = st.columns(3)
+                        val_o = c_o1.number_input("Novo valor", min_value=0.0, value=float(proximas.at[ocorr, 'amount']), step=10.0)
+                        data_o = c_o2.date_input("Nova data", proximas.at[ocorr, 'date'])
+                        stt_o = c_o3.selectbox("Status", ["Pago", "Pendente"], index=0 if proximas.at[ocorr, 'status'] == "Pago" else 1)
+                        b1, b2 = st.columns(2)
+                        if b1.form_submit_button("Salvar ocorrência"):
+                            if commit(storage.set_occurrence, rule['id'], n, date=data_o.strftime("%Y-%m-%d"), amount=val_o, status=stt_o):
+                                st.rerun()
+                        if b2.form_submit_button("Cancelar ocorrência"):
+                            if commit(storage.set_occurrence, rule['id'], n, cancelled=True):
+                                st.rerun()
+                if st.button("Excluir série", key=f"del_rec_{rule['id']}"):
+                    if commit(storage.delete_recurrence, rule['id'], expected_version=versao_recorrencias):
+                        st.rerun()
+
     with tab_meta:
         st.info("Isso criará uma despesa na conta de origem e aumentará o saldo da meta.")
         current_goals = db_data.get('goals', [])
@@ -420,14 +627,61 @@ elif selected == "Nova Transação":
                         "category": "Investimento", "status": "Pago", 
                         "desc": f"Aporte na Meta: {target_goal_name}"
                     }
-                    db_data['transactions'].append(nt)
-                    for g in db_data['goals']:
-                        if g['name'] == target_goal_name:
-                            current_val = safe_float(g.get('current', 0))
-                            g['current'] = current_val + val_m
-                            break
-                    save_user_data(db_data)
+                    commit(storage.add_goal_contribution, nt, target_goal_name, val_m)
                     st.success("Aporte Realizado!")
                     time.sleep(1)
                     st.rerun()
+
+    with tab_imp:
+        st.info("Importe o extrato do banco (CSV ou OFX). Lançamentos já existentes (mesma data, valor, conta e descrição) são ignorados.")
+        with st.form("import_tx"):
+            arquivo = st.file_uploader("Arquivo", type=["csv", "ofx"])
+            c_i1, c_i2, c_i3 = st.columns(3)
+            acc_imp = c_i1.selectbox("Conta", db_data.get('accounts', []) + [c['name'] for c in db_data.get('cards', [])])
+            sep = c_i2.selectbox("Separador (CSV)", [";", ",", "\t"], format_func=lambda x: {"\t": "Tab"}.get(x, x))
+            decimal = c_i3.selectbox("Decimal (CSV)", [",", "."])
+            cat_imp = st.selectbox("Categoria padrão", list(CATEGORY_COLORS.keys()), index=list(CATEGORY_COLORS).index("Outros"))
+            if st.form_submit_button("Importar") and arquivo is not None:
+                if arquivo.name.lower().endswith(".ofx"): chunks = importer.read_ofx_chunks(arquivo)
+                else: chunks = importer.read_csv_chunks(arquivo, sep=sep, decimal=decimal)
+                # Um commit por bloco de linhas, pela mesma fila das demais gravações
+                try:
+                    stats = importer.import_statement(st.session_state['user_email'], chunks, acc_imp,
+                                                      write=lambda records: commit(storage.insert_transactions, records),
+                                                      category=cat_imp)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.success(f"{stats['inserted']} transações importadas · {stats['duplicates']} duplicadas · {stats['invalid']} inválidas.")
     st.markdown('</div>', unsafe_allow_html=True)
+
+page_span.stop()
+if st.session_state.get('_profiler') is not None:
+    st.session_state['_profile_result'] = st.session_state.pop('_profiler').stop()
+
+# --- PAINEL DE DESEMPENHO (somente admins) ---
+if is_admin:
+    with st.sidebar.expander("⏱️ Desempenho"):
+        trace = instrument.current()
+        if trace is not None:
+            rec_trace = trace.to_dict()
+            st.caption(f"Rerun atual: {rec_trace['total_ms']:.0f} ms até aqui")
+            spans = pd.DataFrame(rec_trace['spans'])
+            if not spans.empty:
+                spans['name'] = ["  " * d + n for d, n in zip(spans['depth'], spans['name'])]
+                st.dataframe(spans[['name', 'ms']].round(2), hide_index=True, use_container_width=True)
+            for name, nbytes in rec_trace['payloads'].items():
+                st.caption(f"{name}: {nbytes / 1024:,.1f} KB")
+        st.caption("A captura de memória cobre o processo inteiro (inclui as outras sessões no mesmo intervalo); uma por vez.")
+        if st.session_state.pop('_profile_busy', False):
+            st.warning("Outra captura de perfil está em andamento. Tente de novo em instantes.")
+        if st.button("Capturar perfil (cProfile + tracemalloc)"):
+            st.session_state['_profile_next'] = True
+            st.rerun()
+        prof = st.session_state.get('_profile_result')
+        if prof:
+            st.caption(f"Memória: atual {prof['mem_current'] / 1024:,.0f} KB · pico {prof['mem_peak'] / 1024:,.0f} KB")
+            st.code(prof['cprofile'], language=None)
+            st.code("\n".join(prof['tracemalloc']), language=None)
+
+instrument.end_rerun(st.session_state, page=selected)
@@ -0,0 +1,63 @@
+"""Bytes por transação: lista de dicts e DataFrame genérico (antes) contra o TxStore compacto (depois).
+
+Também confere que o TxStore volta exatamente aos mesmos registros.
+
+Uso: python -m benchmarks.bench_columnar [--sizes 10000 100000]
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from benchmarks import synth
+from finsaas.columnar import TxStore
+from finsaas.finance import add_competence, prepare_transactions
+from finsaas.utils import safe_float
+
+def records_bytes(records):
+    # Tamanho profundo da lista de dicts (cada linha tem seu dict e suas strings)
+    total = sys.getsizeof(records)
+    for r in records:
+        total += sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values())
+    return total
+
+def legacy_prepare(user_db):
+    # O prepare_transactions anterior: DataFrame de objetos montado dos dicts a cada rerun
+    df = pd.DataFrame(user_db['transactions'])
+    df['date'] = pd.to_datetime(df['date'])
+    df['amount'] = df['amount'].apply(safe_float)
+    return add_competence(df, user_db['cards'])
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, (time.perf_counter() - t0) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'representação':>30} {'bytes/tx':>9} {'ms':>9}")
+    for n in args.sizes:
+        user_db = synth.make_user_data(n, np.random.default_rng(args.seed))
+        records = user_db['transactions']
+        store, t_store = timed(lambda: TxStore.from_records(records))
+        assert store.to_records() == records, "TxStore não voltou aos mesmos registros"
+        old_df, t_old = timed(lambda: legacy_prepare(user_db))
+        new_df, t_new = timed(lambda: prepare_transactions({**user_db, 'transactions': store}))
+        rows = [
+            ("lista de dicts (antes)", records_bytes(records), None),
+            ("DataFrame preparado (antes)", old_df.memory_usage(deep=True).sum(), t_old),
+            ("TxStore (depois)", store.nbytes(), t_store),
+            ("DataFrame preparado (depois)", new_df.memory_usage(deep=True).sum(), t_new),
+        ]
+        for name, nbytes, ms in rows:
+            print(f"{n:>8} {name:>30} {nbytes / n:>9.1f} {'' if ms is None else f'{ms:.1f}':>9}")
+        before = records_bytes(records) + rows[1][1]
+        after = store.nbytes() + rows[3][1]
+        print(f"{n:>8} {'residente por sessão':>30} {before / n:>9.1f} -> {after / n:.1f} ({before / after:.1f}x menor)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compara o get_competence antigo (df.apply por linha) com finance.add_competence.
+
+A única diferença esperada é o cartão com closing_day null: o antigo (safe_float(None) = 0)
+jogava todas as despesas para o mês seguinte; o novo trata null como em branco (NaN) e não
+desloca. Essas linhas são conferidas à parte.
+
+Uso: python -m benchmarks.bench_competence [--sizes 10000 100000 1000000]
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from finsaas.finance import add_competence
+from finsaas.utils import safe_float
+
+CARDS = [
+    {"name": "Nubank", "limit": 5000, "closing_day": 15, "due_day": 22},
+    {"name": "Inter", "limit": 3000, "closing_day": "31", "due_day": 5},
+    {"name": "Itaú", "limit": 8000, "closing_day": float("nan"), "due_day": 10},  # em branco no editor
+    {"name": "Sem Fechamento", "limit": 1000},
+    {"name": "Fechamento Nulo", "limit": 2000, "closing_day": None, "due_day": 12},  # null no JSON antigo
+]
+ACCOUNTS = ["Carteira", "Banco", "Nubank", "Inter", "Itaú", "Sem Fechamento", "Fechamento Nulo"]
+NULL_CARDS = ["Fechamento Nulo"]
+
+def make_frame(n, seed=42):
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 6 * 365, n), unit="D")
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "date": pd.to_datetime(days.strftime("%Y-%m-%d")),
+        "type": rng.choice(["Receita", "Despesa"], n),
+        "amount": rng.uniform(1, 500, n).round(2),
+        "account": rng.choice(ACCOUNTS, n),
+    })
+
+def legacy_add_competence(df, cards_list):
+    cards = {c['name']: c for c in cards_list}
+    def get_competence(row):
+        if row.get('account') in cards and row.get('type') == 'Despesa':
+            try:
+                closing = safe_float(cards[row['account']]['closing_day'])
+                if row['date'].day >= closing:
+                    return row['date'] + relativedelta(months=1)
+            except: pass
+        return row['date']
+    df['competencia'] = df.apply(get_competence, axis=1)
+    df['comp_mes'] = df['competencia'].dt.month
+    df['comp_ano'] = df['competencia'].dt.year
+    return df
+
+def timed(fn, df):
+    t0 = time.perf_counter()
+    out = fn(df.copy(), CARDS)
+    return time.perf_counter() - t0, out
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    print(f"{'linhas':>10} {'apply (s)':>10} {'vetor (s)':>10} {'ganho':>8}")
+    for n in args.sizes:
+        df = make_frame(n)
+        t_old, old = timed(legacy_add_competence, df)
+        t_new, new = timed(add_competence, df)
+        null = new['account'].isin(NULL_CARDS)
+        pd.testing.assert_frame_equal(old[~null], new[~null])
+        # Mudança intencional: fechamento null não desloca (o antigo deslocava toda despesa)
+        assert (new.loc[null, 'competencia'] == new.loc[null, 'date']).all()
+        assert (old.loc[null & (old['type'] == 'Despesa'), 'competencia'] != new.loc[null & (new['type'] == 'Despesa'), 'competencia']).all()
+        print(f"{n:>10} {t_old:>10.3f} {t_new:>10.4f} {t_old / t_new:>7.0f}x")
+
+if __name__ == "__main__":
+    main()
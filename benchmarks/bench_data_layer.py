@@ -0,0 +1,187 @@
+"""Benchmark sem interface da camada de dados, em vários tamanhos de banco.
+
+Mede leitura do usuário, processamento do mês, saldo inicial, gravação do
+Extrato e inclusão de uma transação, e grava um relatório JSON que pode ser
+comparado com o de outra execução. Antes das medições, confere que o índice mensal
+(monthly_totals) e as faturas (card_invoices), mantidos por ajustes a cada escrita,
+batem com a reconstrução completa depois de uma sequência aleatória de escritas.
+
+Uso:
+    python -m benchmarks.bench_data_layer --out atual.json
+    python -m benchmarks.bench_data_layer --tiers 20x1000 5x20000 --compare atual.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from benchmarks import synth
+from finsaas import extrato, finance, storage
+
+DEFAULT_TIERS = ["10x1000", "10x10000", "4x100000"]
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "runs": repeat}
+
+def bench_tier(tmp, n_users, n_txs, repeat, seed):
+    path = os.path.join(tmp, f"bench_{n_users}x{n_txs}.db")
+    t0 = time.perf_counter()
+    emails = synth.populate(path, n_users, n_txs, seed)
+    populate_s = time.perf_counter() - t0
+    email = emails[len(emails) // 2]
+    ref = datetime(2023, 6, 1)
+    rng = np.random.default_rng(seed)
+
+    user_db = storage.load_user_data(email)
+    df = finance.prepare_transactions(user_db)
+    window = extrato.editor_frame(storage.query_transactions(email, limit=100))
+
+    def extrato_save():
+        edited = window.copy()
+        edited['amount'] = edited['amount'] + rng.uniform(-1, 1, len(edited)).round(2)
+        storage.apply_transaction_changes(email, *extrato.diff_window(window, edited))
+
+    def append_one():
+        storage.insert_transaction(email, {"id": None, "date": "2023-06-15", "type": "Despesa", "amount": 42.0,
+                                           "account": "Carteira", "category": "Outros", "status": "Pago", "desc": "bench"})
+
+    ops = {
+        "load_user_data": lambda: storage.load_user_data(email),
+        "prepare_transactions": lambda: finance.prepare_transactions(user_db),
+        "month_view": lambda: finance.month_view(df, ref),
+        "opening_balance_scan": lambda: finance.opening_balance(df, ref),
+        "opening_balance_index": lambda: storage.opening_balance(email, ref.year, ref.month),
+        "extrato_window_query": lambda: storage.query_transactions(email, limit=100),
+        "extrato_save_100": extrato_save,
+        "append_transaction": append_one,
+        "save_user_data_full": lambda: storage.save_user_data(email, user_db),
+    }
+    tier = f"{n_users}x{n_txs}"
+    results = [{"tier": tier, "op": "populate", "median_ms": populate_s * 1000, "min_ms": populate_s * 1000, "runs": 1}]
+    for name, fn in ops.items():
+        results.append({"tier": tier, "op": name, **timeit(fn, repeat)})
+    return results
+
+# --- INVARIANTE: AJUSTES INCREMENTAIS == RECONSTRUÇÃO ---
+def _index_snapshot(conn, email):
+    totals = {r['comp']: tuple(r)[1:] for r in conn.execute(
+        "SELECT comp, rec_paid, desp_paid, rec_pend, desp_pend, balance FROM monthly_totals WHERE user = ? ORDER BY comp", (email,))}
+    invoices = {(r['card'], r['comp']): (r['charges'], r['credits']) for r in conn.execute(
+        "SELECT card, comp, charges, credits FROM card_invoices WHERE user = ?", (email,)) if r['charges'] or r['credits']}
+    return totals, invoices
+
+def _assert_same_index(inc, reb, step):
+    (inc_totals, inc_invoices), (reb_totals, reb_invoices) = inc, reb
+    # Meses que ficaram zerados continuam no índice incremental: compara os totais de cada mês
+    # e o saldo acumulado vigente nele (o do último mês presente até ele)
+    inc_bal = reb_bal = 0.0
+    for comp in sorted(set(inc_totals) | set(reb_totals)):
+        a, b = inc_totals.get(comp), reb_totals.get(comp)
+        inc_bal, reb_bal = a[4] if a else inc_bal, b[4] if b else reb_bal
+        assert np.allclose((a or (0.0,) * 5)[:4], (b or (0.0,) * 5)[:4], atol=1e-6), (step, comp, a, b)
+        assert abs(inc_bal - reb_bal) < 1e-6, (step, comp, inc_bal, reb_bal)
+    for key in set(inc_invoices) | set(reb_invoices):
+        assert np.allclose(inc_invoices.get(key, (0.0, 0.0)), reb_invoices.get(key, (0.0, 0.0)), atol=1e-6), \
+            (step, key, inc_invoices.get(key), reb_invoices.get(key))
+
+def check_incremental_indexes(tmp, steps=60, seed=42):
+    """Escritas aleatórias (inclusões, edições, exclusões, lotes, aportes e troca de fechamento dos
+    cartões) e, a cada passo, compara o índice mantido por ajustes com storage.rebuild_indexes."""
+    email = synth.populate(os.path.join(tmp, "invariante.db"), 1, 300, seed)[0]
+    rng = np.random.default_rng(seed)
+    def accounts():
+        data = storage.load_user_data(email)
+        return data['accounts'] + [c['name'] for c in data['cards']]
+
+    def random_tx(tid=None):
+        return {"id": tid, "date": f"{rng.integers(2020, 2025)}-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}",
+                "type": str(rng.choice(["Receita", "Despesa"])), "amount": round(float(rng.uniform(1, 900)), 2),
+                "account": str(rng.choice(accounts())), "category": "Outros",
+                "status": str(rng.choice(["Pago", "Pendente"])), "desc": f"passo {tid}"}
+
+    for step in range(steps):
+        txs = storage.load_transactions(email)
+        op = rng.choice(["insert", "batch", "changes", "cards", "goal"], p=[0.25, 0.15, 0.4, 0.1, 0.1])
+        if op == "insert":
+            storage.insert_transaction(email, random_tx())
+        elif op == "batch":
+            storage.insert_transactions(email, [random_tx() for _ in range(int(rng.integers(1, 20)))])
+        elif op == "changes":
+            picked = rng.choice(len(txs), size=min(len(txs), 10), replace=False)
+            updated = [random_tx(txs[i]['id']) for i in picked[:6]]
+            deleted = [txs[i]['id'] for i in picked[6:]]
+            storage.apply_transaction_changes(email, [random_tx() for _ in range(3)], updated, deleted)
+        elif op == "cards":
+            cards = storage.load_user_data(email)['cards'] or [{"name": "Nubank", "limit": 1000.0, "due_day": 10}]
+            for c in cards: c['closing_day'] = rng.choice([1, 10, 25, 31, None, float("nan")])
+            storage.save_cards(email, cards)
+        else:
+            storage.add_goal_contribution(email, random_tx(), "Viagem", 50.0)
+        conn = storage.connection()
+        inc = _index_snapshot(conn, email)
+        with storage.write_tx(conn=conn):
+            storage.rebuild_indexes(conn, email)
+        _assert_same_index(inc, _index_snapshot(conn, email), f"{step}:{op}")
+    return steps
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f: base = {(r["tier"], r["op"]): r for r in json.load(f)["results"]}
+    print(f"\n{'tier':>12} {'operação':>24} {'antes (ms)':>11} {'agora (ms)':>11} {'razão':>7}")
+    for r in results:
+        b = base.get((r["tier"], r["op"]))
+        if b is None: continue
+        ratio = r["median_ms"] / b["median_ms"] if b["median_ms"] else float("nan")
+        flag = "  <-- mais lento" if ratio > 1.2 else ""
+        print(f"{r['tier']:>12} {r['op']:>24} {b['median_ms']:>11.2f} {r['median_ms']:>11.2f} {ratio:>6.2f}x{flag}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tiers", nargs="+", default=DEFAULT_TIERS, help="USUÁRIOSxTRANSAÇÕES por usuário")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_data_layer.json")
+    parser.add_argument("--compare", help="relatório JSON de uma execução anterior")
+    parser.add_argument("--check-steps", type=int, default=60, help="escritas aleatórias na checagem do índice (0 desliga)")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.check_steps:
+            check_incremental_indexes(tmp, args.check_steps, args.seed)
+            print(f"Índice mensal e faturas conferidos com a reconstrução em {args.check_steps} escritas aleatórias")
+        for tier in args.tiers:
+            n_users, n_txs = (int(x) for x in tier.lower().split("x"))
+            for r in bench_tier(tmp, n_users, n_txs, args.repeat, args.seed):
+                results.append(r)
+                print(f"{r['tier']:>12} {r['op']:>24} {r['median_ms']:>11.2f} ms")
+
+    report = {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                 "python": sys.version.split()[0], "pandas": pd.__version__, "numpy": np.__version__,
+                 "platform": platform.platform(), "seed": args.seed, "repeat": args.repeat},
+        "results": results,
+    }
+    with open(args.out, "w") as f: json.dump(report, f, indent=2)
+    print(f"\nRelatório salvo em {args.out}")
+    if args.compare: compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
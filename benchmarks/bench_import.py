@@ -0,0 +1,65 @@
+"""Orçamento de tempo de import (cold start) do núcleo e do app.
+
+Cada alvo roda num interpretador novo; vale o menor tempo de --runs execuções.
+Também confere que módulos pesados não foram puxados por quem não deveria.
+Sai com código 1 se algum alvo estourar o orçamento.
+
+Uso: python -m benchmarks.bench_import [--runs 5] [--scale 1.5]
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def app_imports():
+    # Os imports de topo do app.py, sem executar a página
+    with open(os.path.join(ROOT, "app.py"), encoding="utf-8") as f: tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(n) for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom)))
+
+# alvo: (código importado, orçamento em ms, módulos que não podem aparecer)
+# O streamlit já importa o pacote base do plotly; o pesado é o plotly.express.
+TARGETS = {
+    "core: finsaas.storage": ("import finsaas.storage, finsaas.writer, finsaas.cache", 150, ["pandas", "streamlit", "plotly.express"]),
+    "core: finsaas.finance": ("import finsaas.finance, finsaas.extrato", 1500, ["streamlit", "plotly.express"]),
+    "app (imports de topo)": (app_imports(), 3000, ["plotly.express"]),
+}
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+exec(compile({code!r}, "<imports>", "exec"))
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({{"ms": ms, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+def measure(code, forbidden, runs):
+    best, loaded = None, []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(code=code, forbidden=forbidden)],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        best = r["ms"] if best is None else min(best, r["ms"])
+        loaded = r["loaded"]
+    return best, loaded
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplica os orçamentos (máquinas lentas)")
+    args = parser.parse_args()
+    failed = False
+    print(f"{'alvo':<24} {'tempo (ms)':>11} {'orçamento':>10}  situação")
+    for name, (code, budget, forbidden) in TARGETS.items():
+        ms, loaded = measure(code, forbidden, args.runs)
+        budget *= args.scale
+        problems = (["acima do orçamento"] if ms > budget else []) + [f"importou {m}" for m in loaded]
+        failed |= bool(problems)
+        print(f"{name:<24} {ms:>11.1f} {budget:>10.0f}  {', '.join(problems) or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
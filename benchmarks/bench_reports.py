@@ -0,0 +1,34 @@
+"""Vazão do relatório em lote (finsaas.reports) com diferentes números de processos.
+
+Uso:
+    python -m benchmarks.bench_reports --users 400 --txs 500 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+from benchmarks import synth
+from finsaas import reports
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--txs", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--chunk", type=int, default=25)
+    parser.add_argument("--start", default="2022-01")
+    parser.add_argument("--end", default="2023-12")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "reports.db")
+        synth.populate(path, args.users, args.txs, args.seed)
+        print(f"{'processos':>10} {'tempo (s)':>10} {'usuários/s':>11} {'speedup':>8}")
+        base = None
+        for workers in sorted(set(args.workers)):
+            stats = reports.run(path, args.start, args.end, os.path.join(tmp, f"out{workers}"), "csv", workers, args.chunk)
+            base = base or stats["seconds"]
+            print(f"{workers:>10} {stats['seconds']:>10.2f} {stats['users'] / stats['seconds']:>11.0f} {base / stats['seconds']:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
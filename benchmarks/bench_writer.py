@@ -0,0 +1,57 @@
+"""Vazão de gravação com N sessões simultâneas: transação por chamada vs CommitQueue.
+
+Uso: python -m benchmarks.bench_writer [--sessions 1 8 32] [--writes 200]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from finsaas import storage
+from finsaas.writer import CommitQueue
+
+def new_tx(i):
+    return {"id": None, "date": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "type": "Despesa", "amount": 10.0 + i,
+            "account": "Carteira", "category": "Outros", "status": "Pago", "desc": f"bench {i}"}
+
+def run_sessions(n_sessions, writes, write_fn):
+    def session(s):
+        for i in range(writes):
+            write_fn(f"user{s}@bench", new_tx(i))
+    threads = [threading.Thread(target=session, args=(s,)) for s in range(n_sessions)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return time.perf_counter() - t0
+
+def fresh_db(tmp, name, n_sessions):
+    path = os.path.join(tmp, name)
+    storage.set_db_path(path)
+    storage.init_db(path, legacy_json=None)
+    for s in range(n_sessions):
+        storage.create_user(f"user{s}@bench", f"Bench {s}", "x")
+    return path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--writes", type=int, default=200, help="gravações por sessão")
+    args = parser.parse_args()
+    print(f"{'sessões':>8} {'direto (tx/s)':>14} {'fila (tx/s)':>12} {'commits':>8} {'ganho':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sessions:
+            total = n * args.writes
+            fresh_db(tmp, f"direct{n}.db", n)
+            t_direct = run_sessions(n, args.writes, storage.insert_transaction)
+
+            path = fresh_db(tmp, f"queue{n}.db", n)
+            writer = CommitQueue(path)
+            t_queue = run_sessions(n, args.writes, lambda email, tx: writer.call(storage.insert_transaction, email, tx))
+            writer.close()
+
+            stored = storage.connect(path).execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+            assert stored == total, f"esperadas {total} transações, gravadas {stored}"
+            print(f"{n:>8} {total / t_direct:>14.0f} {total / t_queue:>12.0f} {writer.batches:>8} {t_direct / t_queue:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Gerador determinístico de bancos sintéticos para os benchmarks."""
+import numpy as np
+import pandas as pd
+from finsaas import storage
+
+CATEGORIES = ["Alimentação", "Moradia", "Transporte", "Lazer", "Saúde", "Educação",
+              "Salário", "Investimento", "Assinaturas", "Compras", "Outros"]
+ACCOUNTS = ["Carteira", "Banco", "Poupança"]
+CARD_NAMES = ["Nubank", "Inter", "Itaú", "C6", "XP"]
+GOAL_NAMES = ["Viagem", "Reserva", "Carro", "Casa", "Curso"]
+
+def user_email(i):
+    return f"user{i:05d}@bench"
+
+def make_user_data(n_txs, rng, start="2020-01-01", years=5):
+    n_cards = int(rng.integers(0, len(CARD_NAMES) + 1))
+    # Fechamentos variados, incluindo os casos herdados do JSON (vazio / sem valor)
+    closings = rng.choice([1, 5, 10, 15, 20, 25, 28, 31, None, ""], n_cards)
+    cards = [{"name": CARD_NAMES[i], "limit": float(rng.integers(5, 200) * 100),
+              "closing_day": closings[i], "due_day": int(rng.integers(1, 29))} for i in range(n_cards)]
+    accounts = ACCOUNTS[:int(rng.integers(1, len(ACCOUNTS) + 1))]
+    goals = [{"name": GOAL_NAMES[i], "target": float(rng.integers(10, 500) * 100),
+              "current": float(rng.integers(0, 100) * 50), "color": "#2D9CDB"}
+             for i in range(int(rng.integers(0, len(GOAL_NAMES) + 1)))]
+    days = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, years * 365, n_txs), unit="D")
+    is_rec = rng.random(n_txs) < 0.2
+    txs = pd.DataFrame({
+        "id": np.arange(1, n_txs + 1),
+        "date": days.strftime("%Y-%m-%d"),
+        "type": np.where(is_rec, "Receita", "Despesa"),
+        "amount": np.where(is_rec, rng.uniform(1000, 8000, n_txs), rng.uniform(5, 600, n_txs)).round(2),
+        "account": rng.choice(accounts + [c["name"] for c in cards], n_txs),
+        "category": np.where(is_rec, "Salário", rng.choice(CATEGORIES, n_txs)),
+        "status": np.where(rng.random(n_txs) < 0.85, "Pago", "Pendente"),
+        "desc": [f"lançamento {i}" for i in range(n_txs)],
+    })
+    return {"transactions": txs.to_dict(orient="records"), "cards": cards, "accounts": accounts, "goals": goals}
+
+def populate(path, n_users, n_txs, seed=42):
+    """Cria n_users usuários com n_txs transações cada no banco SQLite em 'path'."""
+    rng = np.random.default_rng(seed)
+    storage.set_db_path(path)
+    storage.init_db(path, legacy_json=None)
+    for i in range(n_users):
+        email = user_email(i)
+        storage.create_user(email, f"Usuário {i}", "bench")
+        storage.save_user_data(email, make_user_data(n_txs, rng))
+    return [user_email(i) for i in range(n_users)]
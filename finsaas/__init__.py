@@ -0,0 +1,15 @@
+"""Núcleo do FinanSaas, sem Streamlit nem plotly.
+
+storage (SQLite), finance (competência e saldos), invoices (faturas), extrato, importer, export, cache,
+writer e instrument podem ser usados por jobs em lote, como finsaas.reports.
+Os submódulos são carregados sob demanda: ``import finsaas`` não importa
+pandas; só ``finsaas.finance`` (e quem depende dele) importa.
+"""
+import importlib
+
+__all__ = ["archive", "cache", "columnar", "constants", "export", "extrato", "finance", "importer", "instrument", "invoices", "recurrence", "reports", "storage", "utils", "writer"]
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,215 @@
+"""Arquivo frio: anos fechados saem do SQLite para partições Parquet imutáveis por (usuário, ano).
+
+O catálogo (tabela archives) guarda, por partição, o saldo pago do ano e o saldo
+acumulado até o fim dele; archive_totals guarda os totais por competência das
+linhas arquivadas, para o índice mensal continuar completo. O app só carrega a
+partição quente mais o saldo acumulado; anos arquivados são lidos sob demanda.
+
+Uso:
+    python -m finsaas.archive --before 2024          # arquiva tudo com data anterior a 2024
+    python -m finsaas.archive --before 2024 --user ana@x.com
+"""
+import argparse
+import hashlib
+import os
+from datetime import date
+import pandas as pd
+from finsaas import storage
+from finsaas.columnar import TxStore
+from finsaas.instrument import timed
+from finsaas.storage import TX_FIELDS
+
+ARCHIVE_DIR = os.environ.get('FINSAAS_ARCHIVE')
+
+def archive_dir():
+    # Padrão: pasta ao lado do banco, para cada banco ter o seu arquivo
+    return ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(storage.DB_PATH)), 'finsaas_archive')
+
+def partition_path(email, year):
+    # Relativo ao archive_dir; o e-mail vira hash para não ir parar no nome do arquivo
+    return os.path.join(hashlib.sha1(email.encode('utf-8')).hexdigest()[:16], f"{int(year)}.parquet")
+
+def first_year(selected_date):
+    # A competência desloca no máximo um mês: o mês M precisa das datas a partir de M-1
+    d = pd.Timestamp(selected_date) - pd.DateOffset(months=1)
+    return d.year
+
+# --- LEITURA/ESCRITA DAS PARTIÇÕES ---
+def _write_partition(path, columns):
+    import pyarrow as pa, pyarrow.parquet as pq
+    # amount: número em float64; valor gravado como texto no SQLite vai para amount_text
+    amounts = columns['amount']
+    table = pa.table({
+        "id": pa.array(columns['id'], type=pa.int64()),
+        "date": pa.array(columns['date'], type=pa.string()),
+        "type": pa.array(columns['type'], type=pa.string()),
+        "amount": pa.array([v if isinstance(v, float) else None for v in amounts], type=pa.float64()),
+        "amount_text": pa.array([v if isinstance(v, str) else None for v in amounts], type=pa.string()),
+        "account": pa.array(columns['account'], type=pa.string()),
+        "category": pa.array(columns['category'], type=pa.string()),
+        "status": pa.array(columns['status'], type=pa.string()),
+        "desc": pa.array(columns['desc'], type=pa.string()),
+    })
+    full = os.path.join(archive_dir(), path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    pq.write_table(table, full + ".tmp", compression='zstd')
+    os.replace(full + ".tmp", full)
+
+def _read_partition(path):
+    import pyarrow.parquet as pq
+    data = pq.read_table(os.path.join(archive_dir(), path)).to_pydict()
+    data['amount'] = [t if t is not None else a for a, t in zip(data['amount'], data.pop('amount_text'))]
+    return {f: data[f] for f in TX_FIELDS}
+
+def _concat(parts):
+    return {f: [v for p in parts for v in p[f]] for f in TX_FIELDS}
+
+@timed('archive.read_years')
+def read_years(email, years=None, conn=None):
+    """Colunas ({campo: lista}) das partições arquivadas do usuário (todas, ou só as de 'years')."""
+    parts = [p for p in storage.archive_years(email, conn) if years is None or p['year'] in years]
+    return _concat([_read_partition(p['path']) for p in parts])
+
+def row_dicts(columns):
+    return [dict(zip(TX_FIELDS, row)) for row in zip(*(columns[f] for f in TX_FIELDS))]
+
+def _paid_balance(rows):
+    return sum(storage.as_amount(r['amount']) * (1 if r['type'] == 'Receita' else -1)
+               for r in rows if r['status'] == 'Pago' and r['type'] in ('Receita', 'Despesa'))
+
+def _add_archive_totals(conn, email, deltas):
+    for comp, (rp, dp, rn, dn) in deltas.items():
+        conn.execute("INSERT OR IGNORE INTO archive_totals (user, comp) VALUES (?, ?)", (email, comp))
+        conn.execute("""UPDATE archive_totals SET rec_paid = rec_paid + ?, desp_paid = desp_paid + ?,
+            rec_pend = rec_pend + ?, desp_pend = desp_pend + ? WHERE user = ? AND comp = ?""", (rp, dp, rn, dn, email, comp))
+
+def _update_closing_balances(conn, email):
+    balance = 0.0
+    for p in storage.archive_years(email, conn):
+        balance += p['paid_balance']
+        conn.execute("UPDATE archives SET closing_balance = ? WHERE user = ? AND year = ?", (balance, email, p['year']))
+
+# --- ARQUIVAMENTO ---
+@timed('archive.archive_user')
+def archive_user(email, before_year, conn=None):
+    """Move as transações com data anterior a 'before_year' para as partições do usuário. Devolve quantas."""
+    conn = conn or storage.connection()
+    cols = ", ".join(f'"{c}"' for c in TX_FIELDS)  # "desc" é palavra reservada
+    with storage.write_tx(email, conn=conn):
+        rows = conn.execute(f"""SELECT rid, {cols}, comp FROM transactions WHERE user = ?
+            AND date GLOB '[0-9][0-9][0-9][0-9]-*' AND date < ? ORDER BY date, rid""",
+                            (email, f"{int(before_year):04d}-01-01")).fetchall()
+        if not rows: return 0
+        known = {p['year']: p for p in storage.archive_years(email, conn)}
+        by_year = {}
+        for r in rows: by_year.setdefault(int(r['date'][:4]), []).append(r)
+        for year, year_rows in sorted(by_year.items()):
+            new = {f: [r[f] for r in year_rows] for f in TX_FIELDS}
+            path = known[year]['path'] if year in known else partition_path(email, year)
+            old_rows = row_dicts(_read_partition(path)) if year in known else []
+            # Reexecutar depois de uma falha não duplica: o mesmo id substitui a linha antiga
+            ids = set(new['id'])
+            kept = [r for r in old_rows if r['id'] not in ids]
+            _write_partition(path, _concat([{f: [r[f] for r in kept] for f in TX_FIELDS}, new]))
+            all_rows = kept + row_dicts(new)
+            conn.execute("""INSERT OR REPLACE INTO archives (user, year, path, rows, paid_balance, closing_balance)
+                VALUES (?, ?, ?, ?, ?, 0)""", (email, year, path, len(all_rows), _paid_balance(all_rows)))
+        # O índice mensal não muda: as linhas só trocam de lugar
+        _add_archive_totals(conn, email, storage.totals_deltas((r['comp'], r['type'], r['status'], r['amount']) for r in rows))
+        _update_closing_balances(conn, email)
+        storage.reserve_ids(conn, email)  # ids arquivados não voltam em inclusões novas
+        conn.executemany("DELETE FROM transactions WHERE rid = ?", [(r['rid'],) for r in rows])
+    return len(rows)
+
+def refresh_totals(conn, email, closing, deltas):
+    """Recalcula a competência das linhas arquivadas com os fechamentos novos (chamado pelo storage ao salvar cartões)."""
+    rows = row_dicts(read_years(email, conn=conn))
+    new = storage.totals_deltas((storage.competence_key(r, closing), r['type'], r['status'], r['amount']) for r in rows)
+    old = {r['comp']: [r['rec_paid'], r['desp_paid'], r['rec_pend'], r['desp_pend']]
+           for r in conn.execute("SELECT * FROM archive_totals WHERE user = ?", (email,))}
+    for comp in set(new) | set(old):
+        a, b = new.get(comp, [0.0] * 4), old.get(comp, [0.0] * 4)
+        d = deltas.setdefault(comp, [0.0] * 4)
+        for i in range(4): d[i] += a[i] - b[i]
+    conn.execute("DELETE FROM archive_totals WHERE user = ?", (email,))
+    _add_archive_totals(conn, email, new)
+
+# --- CARGA PARA O APP E RELATÓRIOS ---
+@timed('archive.load_user_data')
+def load_user_data(email, from_year=None):
+    """Dados do usuário com as transações quentes (num TxStore) e, se from_year cair em anos
+    arquivados, também as partições a partir dele. 'carry' é o saldo pago acumulado das
+    partições que ficaram de fora (soma-se ao saldo inicial calculado no DataFrame)."""
+    user_db = storage.load_user_data(email, tx_columns=True)
+    txs, carry = user_db['transactions'], 0.0
+    parts = storage.archive_years(email)
+    if parts:
+        load = [p for p in parts if from_year is not None and p['year'] >= from_year]
+        skipped = [p for p in parts if p not in load]
+        if skipped: carry = skipped[-1]['closing_balance']
+        if load: txs = _concat([*(_read_partition(p['path']) for p in load), txs])
+    user_db['transactions'] = TxStore.from_columns(txs)
+    user_db['carry'] = carry
+    return user_db
+
+FILTER_FIELDS = ['date', 'account', 'category', 'status']
+
+def _parts_in_range(email, start, end):
+    first = pd.Timestamp(start).year if start is not None else None
+    last = pd.Timestamp(end).year if end is not None else None
+    return [p for p in storage.archive_years(email)
+            if (first is None or p['year'] >= first) and (last is None or p['year'] <= last)]
+
+def _count_partition(path, start, end, accounts, categories, statuses):
+    # Só as colunas dos filtros, sem montar as linhas
+    import pyarrow.parquet as pq
+    df = pq.read_table(os.path.join(archive_dir(), path), columns=FILTER_FIELDS).to_pandas()
+    return len(_filtered(df, start, end, accounts, categories, statuses))
+
+@timed('archive.count_transactions')
+def count_transactions(email, start=None, end=None, accounts=None, categories=None, statuses=None):
+    return sum(_count_partition(p['path'], start, end, accounts, categories, statuses) for p in _parts_in_range(email, start, end))
+
+@timed('archive.query_transactions')
+def query_transactions(email, start=None, end=None, accounts=None, categories=None, statuses=None, limit=None, offset=0):
+    """Linhas arquivadas no período (mesmos filtros do storage.query_transactions), mais recentes primeiro.
+    Com limit/offset só as partições da janela são lidas inteiras, uma por vez."""
+    out, offset = [], int(offset)
+    for p in reversed(_parts_in_range(email, start, end)):
+        if limit is not None and len(out) >= limit: break
+        if offset:
+            n = _count_partition(p['path'], start, end, accounts, categories, statuses)
+            if offset >= n:
+                offset -= n
+                continue
+        df = _filtered(pd.DataFrame(_read_partition(p['path']), columns=TX_FIELDS), start, end, accounts, categories, statuses)
+        df = df.sort_values('date', ascending=False, kind='stable')
+        df = df.iloc[offset:] if limit is None else df.iloc[offset:offset + limit - len(out)]
+        offset = 0
+        out += df.to_dict(orient='records')
+    return out
+
+def iter_years(email, start=None, end=None, accounts=None, categories=None, statuses=None):
+    """Linhas arquivadas com os mesmos filtros, uma partição (um ano) por vez e em ordem cronológica."""
+    for p in _parts_in_range(email, start, end):
+        df = _filtered(pd.DataFrame(_read_partition(p['path']), columns=TX_FIELDS), start, end, accounts, categories, statuses)
+        if not df.empty: yield df.sort_values('date', kind='stable')
+
+def _filtered(df, start, end, accounts, categories, statuses):
+    mask = pd.Series(True, index=df.index)
+    if start is not None: mask &= df['date'] >= str(start)[:10]
+    if end is not None: mask &= df['date'] <= str(end)[:10]
+    for col, values in (('account', accounts), ('category', categories), ('status', statuses)):
+        if values: mask &= df[col].isin(values)
+    return df[mask]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arquiva os anos fechados em partições Parquet por usuário.")
+    parser.add_argument("--db", default=storage.DB_PATH)
+    parser.add_argument("--before", type=int, default=date.today().year, help="arquiva datas anteriores a este ano")
+    parser.add_argument("--user", action="append", help="só estes usuários (padrão: todos)")
+    args = parser.parse_args()
+    storage.set_db_path(args.db)
+    emails = args.user or storage.list_users()
+    total = sum(archive_user(email, args.before) for email in emails)
+    print(f"{total} transações de {len(emails)} usuários arquivadas em {archive_dir()}")
@@ -0,0 +1,80 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# --- CACHE ENTRE RERUNS ---
+def estimate_bytes(value):
+    if hasattr(value, 'memory_usage'):  # DataFrame/Series (sem importar o pandas aqui)
+        nbytes = value.memory_usage(deep=True)
+        return int(nbytes.sum() if hasattr(nbytes, 'sum') else nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_bytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(estimate_bytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+class FrameCache:
+    """LRU compartilhado entre sessões, com teto de memória.
+
+    As chaves são tuplas (usuário, versão dos dados, ...). Ao gravar uma versão
+    nova de um usuário, as entradas das versões anteriores são descartadas.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes=None):
+        nbytes = estimate_bytes(value) if nbytes is None else nbytes
+        with self._lock:
+            user, version = key[0], key[1]
+            if self._versions.get(user, version) != version:
+                if version < self._versions[user]: return value
+                self.invalidate(user)
+            self._versions[user] = version
+            self._pop(key)
+            self._items[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def invalidate(self, user):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == user]:
+                self._pop(key)
+            self._versions.pop(user, None)
+
+    def _pop(self, key):
+        item = self._items.pop(key, None)
+        if item is not None: self.nbytes -= item[1]
+
+    def _evict(self):
+        # Remove os menos usados até caber no orçamento (a entrada recém-inserida sempre fica)
+        while len(self._items) > 1 and (self.nbytes > self.max_bytes or len(self._items) > self.max_entries):
+            key, (_, nbytes) = self._items.popitem(last=False)
+            self.nbytes -= nbytes
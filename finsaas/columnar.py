@@ -0,0 +1,152 @@
+import sys
+from datetime import date
+import numpy as np
+import pandas as pd
+from finsaas.constants import CATEGORIES, TX_STATUSES, TX_TYPES
+from finsaas.storage import TX_FIELDS
+from finsaas.utils import safe_float
+
+# --- TRANSAÇÕES EM COLUNAS COMPACTAS ---
+# Em vez de uma lista de dicts (um dict e várias strings por linha), cada campo vira
+# um array: códigos inteiros para type/status/account/category, ordinal int32 para a
+# data, float64 para o valor e int64 para o id. Valores que não cabem no formato
+# compacto (data fora do ISO, id ausente, valor em texto...) ficam em 'extras'
+# e voltam exatamente como vieram em to_records().
+KNOWN_VOCAB = {"type": TX_TYPES, "status": TX_STATUSES, "category": CATEGORIES, "account": []}
+CODED_FIELDS = list(KNOWN_VOCAB)
+NO_DATE = 0  # date.toordinal() começa em 1
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _encode_dates(values):
+    s = pd.Series(values, dtype=object)
+    ok = (s.str.len() == 10).to_numpy(dtype=bool)  # .str dá NaN para o que não é string
+    days = pd.to_datetime(s.where(ok), format='%Y-%m-%d', errors='coerce').to_numpy().astype('datetime64[D]')
+    # Só fica compacto o que volta idêntico (descarta '2023-2-01 ', datas inválidas etc.)
+    ok = ok & ~np.isnat(days)
+    ok[ok] = np.datetime_as_string(days[ok], unit='D') == s[ok].to_numpy().astype(str)
+    ordinals = np.where(ok, days.astype('int64') + EPOCH_ORDINAL, NO_DATE).astype('int32')
+    return ordinals, ~ok
+
+def _decode_dates(ordinals):
+    missing = ordinals == NO_DATE
+    days = (ordinals.astype('int64') - EPOCH_ORDINAL).astype('datetime64[D]')
+    days[missing] = np.datetime64('NaT')
+    return days, missing
+
+class TxStore:
+    """Transações de um usuário em colunas. Imutável: escritas passam pelo storage e geram outra versão."""
+
+    def __init__(self, ids, dates, amounts, codes, vocab, desc, extras):
+        self.ids, self.dates, self.amounts, self.desc = ids, dates, amounts, desc
+        self.codes, self.vocab = codes, vocab
+        self.extras = extras  # {linha: {campo: valor original}}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_records(cls, records):
+        store = cls.from_columns({f: [r.get(f) for r in records] for f in TX_FIELDS})
+        # Chaves além de TX_FIELDS (ou faltando) também são preservadas
+        keys = set(TX_FIELDS)
+        for i, r in enumerate(records):
+            if r.keys() != keys:
+                other = {k: v for k, v in r.items() if k not in keys}
+                missing = [k for k in TX_FIELDS if k not in r]
+                if other: store.extras.setdefault(i, {})['__keys__'] = other
+                if missing: store.extras.setdefault(i, {})['__missing__'] = missing
+        return store
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Monta o store a partir de {campo: lista de valores} (ex.: storage.load_user_data(..., tx_columns=True))."""
+        n = len(columns['id'])
+        extras = {}
+        def keep(rows, field, values):
+            for i in np.flatnonzero(rows): extras.setdefault(int(i), {})[field] = values[i]
+
+        ids_raw = columns['id']
+        if pd.api.types.infer_dtype(ids_raw, skipna=False) == 'integer':
+            ids = np.asarray(ids_raw, dtype='int64')
+        else:
+            id_ok = np.fromiter((isinstance(v, (int, np.integer)) and not isinstance(v, bool) and -2**63 <= v < 2**63 for v in ids_raw), dtype=bool, count=n)
+            ids = np.fromiter((v if ok else 0 for v, ok in zip(ids_raw, id_ok)), dtype='int64', count=n)
+            keep(~id_ok, 'id', ids_raw)
+
+        dates_raw = columns['date']
+        dates, bad = _encode_dates(dates_raw)
+        keep(bad, 'date', dates_raw)
+
+        amounts_raw = columns['amount']
+        if pd.api.types.infer_dtype(amounts_raw, skipna=False) == 'floating':
+            amounts = np.asarray(amounts_raw, dtype='float64')
+        else:
+            amount_ok = np.fromiter((isinstance(v, (float, np.floating)) for v in amounts_raw), dtype=bool, count=n)
+            amounts = np.fromiter((v if ok else np.nan for v, ok in zip(amounts_raw, amount_ok)), dtype='float64', count=n)
+            keep(~amount_ok, 'amount', amounts_raw)
+
+        codes, vocab = {}, {}
+        for field in CODED_FIELDS:
+            raw = columns[field]
+            known = KNOWN_VOCAB[field]
+            cat = pd.Categorical(raw)
+            # Caminho rápido: só strings e None (o normal vindo do SQLite); NaN ou números vão para extras
+            if pd.api.types.infer_dtype(cat.categories, skipna=False) not in ('string', 'empty') \
+                    or (cat.codes == -1).sum() != list(raw).count(None):
+                is_str = np.fromiter((type(v) is str for v in raw), dtype=bool, count=n)
+                keep(~is_str & np.fromiter((v is not None for v in raw), dtype=bool, count=n), field, raw)
+                cat = pd.Categorical([v if ok else None for v, ok in zip(raw, is_str)])
+            vocab[field] = known + sorted(set(cat.categories).difference(known))
+            codes[field] = cat.set_categories(vocab[field]).codes
+
+        desc = np.empty(n, dtype=object)
+        desc[:] = columns['desc']
+        return cls(ids, dates, amounts, codes, vocab, desc, extras)
+
+    def to_records(self):
+        days, missing = _decode_dates(self.dates)
+        date_str = np.datetime_as_string(days, unit='D').astype(object)
+        date_str[missing] = None
+        columns = {"id": self.ids.tolist(), "date": date_str.tolist(), "amount": self.amounts.tolist(), "desc": self.desc.tolist()}
+        for field in CODED_FIELDS:
+            lookup = np.array(self.vocab[field] + [None], dtype=object)
+            columns[field] = lookup[self.codes[field]].tolist()  # código -1 pega o None do fim
+        records = [dict(zip(TX_FIELDS, row)) for row in zip(*(columns[f] for f in TX_FIELDS))]
+        for i, fields in self.extras.items():
+            r = records[i]
+            for k, v in fields.items():
+                if k == '__keys__': r.update(v)
+                elif k == '__missing__':
+                    for m in v: r.pop(m, None)
+                else: r[k] = v
+        return records
+
+    def frame(self):
+        """DataFrame para o processamento do mês, sem reparsear datas nem strings."""
+        days, _ = _decode_dates(self.dates)
+        df = pd.DataFrame({
+            "id": pd.array(self.ids, dtype='Int64'),
+            "date": pd.to_datetime(days).as_unit('us'),  # mesma unidade do to_datetime em strings
+            "type": pd.Categorical.from_codes(self.codes['type'], self.vocab['type']),
+            "amount": self.amounts.copy(),
+            "account": pd.Categorical.from_codes(self.codes['account'], self.vocab['account']),
+            "category": pd.Categorical.from_codes(self.codes['category'], self.vocab['category']),
+            "status": pd.Categorical.from_codes(self.codes['status'], self.vocab['status']),
+            "desc": self.desc,
+        })
+        # Valores fora do formato compacto: mesma leitura tolerante de antes (safe_float / to_datetime)
+        for i, fields in self.extras.items():
+            if 'id' in fields: df.loc[i, 'id'] = pd.NA
+            if 'date' in fields: df.loc[i, 'date'] = pd.to_datetime(fields['date'], errors='coerce')
+            if 'amount' in fields: df.loc[i, 'amount'] = safe_float(fields['amount'])
+        return df
+
+    def nbytes(self):
+        arrays = [self.ids, self.dates, self.amounts, *self.codes.values()]
+        strings = sum(sys.getsizeof(s) for s in self.desc if s is not None)
+        vocab = sum(sys.getsizeof(v) for vs in self.vocab.values() for v in vs)
+        return sum(a.nbytes for a in arrays) + self.desc.nbytes + strings + vocab + sys.getsizeof(self.extras)
+
+    def memory_usage(self, deep=True):
+        # Para o FrameCache/estimate_bytes contarem o tamanho real
+        return self.nbytes()
@@ -0,0 +1,10 @@
+# --- DEFINIÇÃO DE CORES DAS CATEGORIAS ---
+CATEGORY_COLORS = {
+    "Alimentação": "#FF9F43", "Moradia": "#54A0FF", "Transporte": "#F368E0",
+    "Lazer": "#00D2D3", "Saúde": "#FF6B6B", "Educação": "#5F27CD",
+    "Salário": "#1DD1A1", "Investimento": "#222F3E", "Assinaturas": "#8395A7",
+    "Compras": "#FF9FF3", "Outros": "#C8D6E5"
+}
+CATEGORIES = list(CATEGORY_COLORS.keys())
+TX_TYPES = ["Receita", "Despesa"]
+TX_STATUSES = ["Pago", "Pendente"]
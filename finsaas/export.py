@@ -0,0 +1,173 @@
+"""Exportação do Extrato em CSV, XLSX ou Parquet, em blocos de tamanho fixo.
+
+As linhas vêm do SQLite pelo storage.iter_transactions e, se o período alcança anos
+arquivados, das partições (uma por vez). Cada bloco é gravado no arquivo e descartado,
+então a memória não cresce com o histórico. A coluna competencia (AAAA-MM) segue a
+mesma regra do índice mensal: despesa no cartão a partir do fechamento vai para o mês
+seguinte. Ocorrências das recorrências (que o Dashboard e a Tendência somam) vêm
+depois dos lançamentos gravados, sem id e expandidas um ano de competência por vez;
+sem data final no filtro, as séries sem fim vão até o mês atual. XLSX usa o openpyxl (modo write_only) e Parquet o pyarrow, importados só
+quando pedidos.
+
+Uso:
+    python -m finsaas.export ana@x.com --format xlsx --out extrato.xlsx
+    python -m finsaas.export ana@x.com --start 2024-01-01 --end 2024-12-31 --account Nubank
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+import pandas as pd
+from finsaas import storage
+from finsaas.instrument import timed
+from finsaas.storage import TX_FIELDS
+
+EXPORT_COLS = [*TX_FIELDS, 'competencia']
+MIME_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+XLSX_MAX_ROWS = 1048575  # por planilha, sem contar o cabeçalho
+TEMP_PREFIX = "finsaas_export_"
+TEMP_TTL_S = int(os.environ.get('FINSAAS_EXPORT_TTL', 3600))
+
+class ChunkWriter:
+    """Grava DataFrames conforme chegam, sem juntar o arquivo inteiro na memória."""
+
+    def __init__(self, path, fmt):
+        if fmt not in MIME_TYPES: raise ValueError(f"formato desconhecido: {fmt}")
+        self.path, self.fmt = path, fmt
+        self.rows = 0
+        self._parquet = None
+        self._book = self._sheet = None
+        self._sheet_rows = 0
+        if os.path.exists(path): os.remove(path)
+
+    def write(self, df):
+        if df.empty: return
+        df = df.astype({c: 'string' for c in df.columns if df[c].dtype == object})
+        if self.fmt == 'csv':
+            df.to_csv(self.path, mode='a', header=self.rows == 0, index=False)
+        elif self.fmt == 'xlsx':
+            self._write_xlsx(df)
+        else:
+            import pyarrow as pa, pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None: self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+        self.rows += len(df)
+
+    def _write_xlsx(self, df):
+        if self._book is None:
+            from openpyxl import Workbook
+            self._book = Workbook(write_only=True)  # linhas vão para disco, não para a memória
+        # NA vira célula vazia
+        values = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        for row in values:
+            if self._sheet is None or self._sheet_rows >= XLSX_MAX_ROWS:
+                self._sheet = self._book.create_sheet(f"Extrato {len(self._book.worksheets) + 1}")
+                self._sheet.append(list(df.columns))
+                self._sheet_rows = 0
+            self._sheet.append(row)
+            self._sheet_rows += 1
+
+    def close(self):
+        if self._parquet is not None: self._parquet.close()
+        if self._book is not None: self._book.save(self.path)
+
+def _frame(df):
+    # Tipos fixos em todos os blocos (o Parquet exige o mesmo schema do primeiro)
+    df = df.reindex(columns=EXPORT_COLS)
+    df['id'] = pd.to_numeric(df['id'], errors='coerce').astype('Int64')
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').astype('float64')
+    return df.astype({c: 'string' for c in EXPORT_COLS if c not in ('id', 'amount')})
+
+def iter_chunks(email, chunksize=10000, **filters):
+    """Blocos (DataFrames com EXPORT_COLS) das transações do usuário em ordem cronológica, seguidas
+    das ocorrências das recorrências no período.
+    filters: start, end, accounts, categories, statuses (como no storage.query_transactions)."""
+    cutoff = storage.archive_cutoff(email)
+    start = filters.get('start')
+    if cutoff is not None and (start is None or pd.Timestamp(start).year < cutoff):
+        from finsaas import archive  # só quem tem anos arquivados paga o import do pyarrow
+        closing = storage.card_closing(email)
+        for year_df in archive.iter_years(email, **filters):
+            year_df['competencia'] = [storage.competence_key(r, closing) for r in year_df.to_dict(orient='records')]
+            for i in range(0, len(year_df), chunksize):
+                yield _frame(year_df.iloc[i:i + chunksize])
+    for rows in storage.iter_transactions(email, columns=[*TX_FIELDS, 'comp'], chunksize=chunksize, **filters):
+        yield _frame(pd.DataFrame(rows, columns=[*TX_FIELDS, 'comp']).rename(columns={'comp': 'competencia'}))
+    yield from _recurring_chunks(email, chunksize, **filters)
+
+def _recurring_chunks(email, chunksize, start=None, end=None, accounts=None, categories=None, statuses=None):
+    user_db = storage.load_recurrences(email)
+    if not user_db['recurrences']: return
+    from finsaas import recurrence  # só quem tem recorrências
+    rules = [r for r in user_db['recurrences'] if recurrence.is_valid(r)]
+    if not rules: return
+    user_db['cards'] = storage.load_cards(email)
+    first = pd.Timestamp(start) if start is not None else min(recurrence.first_date(r) for r in rules)
+    ends = [recurrence.last_date(r) for r in rules]
+    last = pd.Timestamp(end) if end is not None else max(pd.Timestamp.today().normalize(), *(d for d in ends if d is not None))
+    # A data cai em [first, last]; a competência, no máximo um mês depois
+    months = pd.period_range(pd.Period(first, 'M'), pd.Period(last, 'M') + 1, freq='M')
+    for i in range(0, len(months), 12):
+        occ = recurrence.expand(user_db, months[i], months[min(i + 11, len(months) - 1)])
+        if occ.empty: continue
+        mask = (occ['date'] >= first) & (occ['date'] <= last)
+        for col, values in (('account', accounts), ('category', categories), ('status', statuses)):
+            if values: mask &= occ[col].isin(values)
+        occ = occ[mask]
+        if occ.empty: continue
+        occ = occ.assign(date=occ['date'].dt.strftime('%Y-%m-%d'), competencia=occ['competencia'].dt.strftime('%Y-%m'))
+        for j in range(0, len(occ), chunksize):
+            yield _frame(occ.iloc[j:j + chunksize])
+
+@timed('export.export_transactions')
+def export_transactions(email, path, fmt='csv', chunksize=10000, **filters):
+    """Grava as transações filtradas em 'path' no formato 'fmt'. Devolve quantas linhas."""
+    writer = ChunkWriter(path, fmt)
+    try:
+        for chunk in iter_chunks(email, chunksize, **filters):
+            writer.write(chunk)
+    finally:
+        writer.close()
+    if writer.rows == 0:
+        # Nenhuma linha no filtro: só o cabeçalho, para o download não sair vazio
+        empty = _frame(pd.DataFrame(columns=EXPORT_COLS))
+        {'csv': empty.to_csv, 'xlsx': empty.to_excel, 'parquet': empty.to_parquet}[fmt](path, index=False)
+    return writer.rows
+
+def temp_path(fmt):
+    """Arquivo temporário para uma exportação (apagado no download ou, depois de TEMP_TTL_S, pelo sweep_temp_files)."""
+    fd, path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=f".{fmt}")
+    os.close(fd)
+    return path
+
+def sweep_temp_files(max_age=TEMP_TTL_S):
+    # Exportações de sessões que terminaram sem baixar o arquivo
+    cutoff = time.time() - max_age
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), TEMP_PREFIX + "*")):
+        try:
+            if os.path.getmtime(path) < cutoff: os.remove(path)
+        except OSError: pass  # outra sessão apagou antes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta o Extrato de um usuário.")
+    parser.add_argument("email")
+    parser.add_argument("--db", default=storage.DB_PATH)
+    parser.add_argument("--format", choices=list(MIME_TYPES), default="csv")
+    parser.add_argument("--out", help="arquivo de saída (padrão: extrato.<formato>)")
+    parser.add_argument("--start", help="primeira data (AAAA-MM-DD)")
+    parser.add_argument("--end", help="última data (AAAA-MM-DD)")
+    parser.add_argument("--account", action="append", help="só estas contas/cartões")
+    parser.add_argument("--category", action="append", help="só estas categorias")
+    parser.add_argument("--chunk", type=int, default=10000, help="linhas por bloco")
+    args = parser.parse_args()
+    storage.set_db_path(args.db)
+    out = args.out or f"extrato.{args.format}"
+    n = export_transactions(args.email, out, args.format, args.chunk, start=args.start, end=args.end,
+                            accounts=args.account, categories=args.category)
+    print(f"{n} transações exportadas para {out}")
@@ -0,0 +1,41 @@
+from datetime import datetime, date
+import pandas as pd
+from finsaas.instrument import timed
+from finsaas.storage import TX_FIELDS
+from finsaas.utils import safe_float
+
+# --- EXTRATO EM JANELAS ---
+@timed('extrato.editor_frame')
+def editor_frame(rows):
+    df = pd.DataFrame(rows, columns=TX_FIELDS)
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['amount'] = df['amount'].apply(safe_float)
+    df['Excluir'] = False
+    return df
+
+def _date_str(x):
+    if isinstance(x, (datetime, date)) and not pd.isna(x): return x.strftime('%Y-%m-%d')
+    return None if pd.isna(x) else x
+
+def frame_records(df):
+    out = df.drop(columns=['Excluir'], errors='ignore').copy()
+    out['date'] = out['date'].apply(_date_str)
+    return [{k: (None if not isinstance(v, str) and pd.isna(v) else v) for k, v in r.items()}
+            for r in out.to_dict(orient='records')]
+
+@timed('extrato.diff_window')
+def diff_window(original, edited):
+    """Compara a janela exibida com a editada: (inseridas, alteradas, ids excluídos)."""
+    before = {int(r['id']): r for r in frame_records(original)}
+    keep = edited[edited['Excluir'] == False]
+    inserted, updated, seen = [], [], set()
+    for r in frame_records(keep):
+        if r.get('id') is None:
+            inserted.append(r)
+            continue
+        r['id'] = int(r['id'])
+        seen.add(r['id'])
+        if r['id'] not in before: inserted.append(r)
+        elif r != before[r['id']]: updated.append(r)
+    deleted = [tid for tid in before if tid not in seen]
+    return inserted, updated, deleted
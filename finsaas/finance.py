@@ -0,0 +1,149 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from finsaas.columnar import TxStore
+from finsaas.instrument import timed
+from finsaas.utils import safe_float
+
+# --- COMPETÊNCIA (VETORIZADA) ---
+def card_closing_map(cards_list):
+    # Cartão sem 'closing_day' nunca desloca a competência (era o KeyError engolido no get_competence);
+    # em branco (NaN do editor) também não. O null do JSON antigo (safe_float → 0) deslocava todas as
+    # despesas; no SQLite null e NaN viram o mesmo NULL, então o null agora segue o NaN
+    closing = {}
+    for c in cards_list:
+        day = c.get('closing_day')
+        closing[c['name']] = np.nan if day is None or day != day else safe_float(day)
+    return closing
+
+@timed('finance.competence')
+def competence(df, cards_list):
+    """Data de competência de cada linha: despesas no cartão a partir do dia de fechamento vão para o mês seguinte."""
+    dates = df['date']
+    if not cards_list or 'account' not in df.columns or 'type' not in df.columns:
+        return dates.copy()
+    closing = df['account'].map(card_closing_map(cards_list)).astype('float64')
+    shift = (df['type'] == 'Despesa').to_numpy() & (dates.dt.day.to_numpy(dtype='float64', na_value=np.nan) >= closing.to_numpy())
+    if not shift.any():
+        return dates.copy()
+    comp = dates.copy()
+    comp[shift] = dates[shift] + pd.DateOffset(months=1)
+    return comp
+
+def add_competence(df, cards_list):
+    df['competencia'] = competence(df, cards_list)
+    df['comp_mes'] = df['competencia'].dt.month
+    df['comp_ano'] = df['competencia'].dt.year
+    return df
+
+# --- PROCESSAMENTO DO MÊS ---
+@timed('finance.prepare_transactions')
+def prepare_transactions(user_db):
+    txs = user_db.get('transactions', [])
+    cards_list = user_db.get('cards', [])
+    cols = ['id', 'date', 'type', 'amount', 'account', 'category', 'status', 'desc', 'competencia', 'comp_mes', 'comp_ano']
+    
+    if not len(txs): return pd.DataFrame(columns=cols)
+
+    # Colunas compactas: categorias como códigos e datas já convertidas (sem reparsear strings)
+    store = txs if isinstance(txs, TxStore) else TxStore.from_records(txs)
+    return add_competence(store.frame(), cards_list)
+
+@timed('finance.month_view')
+def month_view(df, selected_date):
+    if df.empty: return df
+    return df[(df['comp_mes'] == selected_date.month) & (df['comp_ano'] == selected_date.year)]
+
+def opening_balance(df, selected_date):
+    if df.empty: return 0.0
+    mask_ant = df['competencia'] < datetime(selected_date.year, selected_date.month, 1)
+    df_ant = df[mask_ant]
+    
+    rec = df_ant[(df_ant['type'] == 'Receita') & (df_ant['status'] == 'Pago')]['amount'].sum()
+    desp = df_ant[(df_ant['type'] == 'Despesa') & (df_ant['status'] == 'Pago')]['amount'].sum()
+    
+    return rec - desp
+
+def concat_view(view, occurrences):
+    # Lançamentos gravados + ocorrências expandidas das recorrências, na ordem de data
+    if occurrences.empty: return view
+    if view.empty: return occurrences
+    return pd.concat([view, occurrences], ignore_index=True).sort_values('date', kind='stable')
+
+# --- RESUMO POR MÊS (VÁRIOS MESES DE UMA VEZ) ---
+def month_range(start, end):
+    return pd.period_range(pd.Period(start, 'M'), pd.Period(end, 'M'), freq='M')
+
+SUMMARY_COLS = ['mes', 'saldo_inicial', 'receitas', 'despesas', 'balanco', 'saldo_final',
+                 'receitas_pendentes', 'despesas_pendentes', 'saldo_projetado']
+
+def period_frame(user_db, df, months):
+    """df mais as ocorrências das recorrências no período, o 'carry' com o saldo pago de antes dele
+    e o saldo pendente das ocorrências de antes dele (para o saldo projetado)."""
+    carry, pending = user_db.get('carry', 0.0), 0.0
+    if user_db.get('recurrences'):
+        from finsaas import recurrence  # recurrence usa este módulo
+        df = concat_view(df, recurrence.expand(user_db, months[0], months[-1]))
+        carry += recurrence.balance_before(user_db, months[0])
+        pending = recurrence.balance_before(user_db, months[0], status='Pendente')
+    return df, carry, pending
+
+@timed('finance.monthly_summary')
+def monthly_summary(df, months, carry=0.0, pending=0.0):
+    """Saldo inicial, receitas, despesas, balanço e saldo final de cada mês de 'months', com as mesmas
+    regras do month_view/opening_balance (os saldos só contam o que foi pago, mais o 'carry').
+    No mesmo agrupamento: o que está pendente no mês e o saldo projetado (se tudo o que está
+    pendente até o fim do mês for pago nele; 'pending' é o que ficou pendente antes do df)."""
+    out = pd.DataFrame({'mes': months.astype(str)})
+    if df.empty:
+        for col in ('receitas', 'despesas', 'balanco', 'receitas_pendentes', 'despesas_pendentes'): out[col] = 0.0
+        out['saldo_inicial'] = out['saldo_final'] = carry
+        out['saldo_projetado'] = carry + pending
+        return out[SUMMARY_COLS]
+    comp = df['competencia'].dt.to_period('M')
+    rec = df['amount'].where(df['type'] == 'Receita', 0.0)
+    desp = df['amount'].where(df['type'] == 'Despesa', 0.0)
+    paid = (df['status'] == 'Pago').to_numpy()
+    by_month = pd.DataFrame({'comp': comp, 'rec': rec, 'desp': desp, 'pago': (rec - desp).where(paid, 0.0),
+                             'rec_pend': rec.where(~paid, 0.0), 'desp_pend': desp.where(~paid, 0.0)}) \
+        .dropna(subset=['comp']).groupby('comp').sum().sort_index()
+    # Saldo acumulado até o fim de cada competência; o inicial de M é o da última competência < M
+    cum = by_month['pago'].cumsum().to_numpy()
+    cum_all = (by_month['rec'] - by_month['desp']).cumsum().to_numpy()
+    def balance_before(side, cum=cum):
+        pos = np.searchsorted(by_month.index.asi8, months.asi8, side=side)
+        return carry + (np.where(pos > 0, cum[np.maximum(pos - 1, 0)], 0.0) if len(cum) else 0.0)
+    out['saldo_inicial'] = balance_before('left')
+    month_rows = by_month.reindex(months)
+    out['receitas'] = month_rows['rec'].fillna(0.0).to_numpy()
+    out['despesas'] = month_rows['desp'].fillna(0.0).to_numpy()
+    out['balanco'] = out['receitas'] - out['despesas']
+    out['saldo_final'] = balance_before('right')
+    out['receitas_pendentes'] = month_rows['rec_pend'].fillna(0.0).to_numpy()
+    out['despesas_pendentes'] = month_rows['desp_pend'].fillna(0.0).to_numpy()
+    out['saldo_projetado'] = balance_before('right', cum_all) + pending
+    return out[SUMMARY_COLS]
+
+def goals_remaining(goals):
+    # Quanto falta para completar todas as metas (as já batidas não contam)
+    return sum(max(safe_float(g.get('target')) - safe_float(g.get('current')), 0.0) for g in goals)
+
+def cash_flow(user_db, df, months):
+    """Tendência de vários meses num só agrupamento: o monthly_summary do período (com recorrências)
+    e o saldo projetado livre depois de reservar o que falta para as metas."""
+    df, carry, pending = period_frame(user_db, df, months)
+    out = monthly_summary(df, months, carry, pending)
+    out['reserva_metas'] = goals_remaining(user_db.get('goals', []))
+    out['saldo_livre'] = out['saldo_projetado'] - out['reserva_metas']
+    return out
+
+def category_totals(df, months):
+    # Total por (mês, tipo, categoria), como o gráfico "Por Categoria" do Dashboard
+    cols = ['mes', 'type', 'category', 'amount']
+    if df.empty: return pd.DataFrame(columns=cols)
+    comp = df['competencia'].dt.to_period('M')
+    sel = df[comp.isin(months)]
+    if sel.empty: return pd.DataFrame(columns=cols)
+    totals = sel.groupby([comp[comp.isin(months)].astype(str).rename('mes'), 'type', 'category'], dropna=False)['amount'].sum()
+    out = totals.reset_index()[cols]
+    return out.astype({'type': object, 'category': object})
@@ -0,0 +1,168 @@
+import codecs
+import re
+import numpy as np
+import pandas as pd
+from finsaas import storage
+from finsaas.instrument import timed
+
+# --- IMPORTAÇÃO DE EXTRATOS (CSV / OFX) ---
+# Nomes de coluna aceitos no CSV para cada campo da transação (comparação sem maiúsculas)
+COLUMN_ALIASES = {
+    'date': ['date', 'data', 'data lançamento', 'data lancamento', 'dt'],
+    'amount': ['amount', 'valor', 'value', 'valor (r$)'],
+    'desc': ['desc', 'descrição', 'descricao', 'description', 'histórico', 'historico', 'memo', 'lançamento', 'lancamento'],
+    'type': ['type', 'tipo'],
+    'account': ['account', 'conta'],
+    'category': ['category', 'categoria'],
+    'status': ['status', 'situação', 'situacao'],
+}
+DEDUP_FIELDS = ['date', 'amount', 'account', 'desc']
+CHUNK_SIZE = 5000
+
+def guess_mapping(columns):
+    lower = {str(c).strip().lower(): c for c in columns}
+    return {field: lower[a] for field, aliases in COLUMN_ALIASES.items() for a in aliases if a in lower}
+
+# --- LEITORES (geram DataFrames com colunas já nos nomes da transação) ---
+def read_csv_chunks(source, mapping=None, sep=',', decimal='.', encoding='utf-8-sig', chunksize=CHUNK_SIZE):
+    reader = pd.read_csv(source, sep=sep, encoding=encoding, chunksize=chunksize,
+                         dtype=str, keep_default_na=False, skipinitialspace=True)
+    for chunk in reader:
+        cols = mapping or guess_mapping(chunk.columns)
+        missing = [name for f, name in (('date', 'data'), ('amount', 'valor')) if f not in cols]
+        if missing:
+            raise ValueError(f"CSV sem coluna de {' e de '.join(missing)} (cabeçalhos: {', '.join(map(str, chunk.columns))}). "
+                             "Use nomes como Data e Valor.")
+        chunk = chunk[list(cols.values())].set_axis(list(cols.keys()), axis=1)
+        if 'amount' in chunk.columns:
+            amount = chunk['amount'].str.replace(r'[R$\s]', '', regex=True)
+            if decimal != '.':
+                amount = amount.str.replace('.', '', regex=False).str.replace(decimal, '.', regex=False)
+            chunk['amount'] = amount
+        yield chunk
+
+_STMTTRN = re.compile(r'<STMTTRN>(.*?)</STMTTRN>', re.S | re.I)
+_OFX_TAG = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+def _ofx_encoding(head):
+    head = head.upper()
+    if b'CHARSET:1252' in head or b'ISO-8859' in head or b'CHARSET:8859' in head: return 'cp1252'
+    return 'utf-8'
+
+def read_ofx_chunks(source, chunksize=CHUNK_SIZE, block=1 << 16):
+    """Lê os <STMTTRN> de um OFX (SGML 1.x ou XML 2.x) em blocos, sem carregar o arquivo inteiro."""
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        raw = f.read(block)
+        decoder = codecs.getincrementaldecoder(_ofx_encoding(raw[:1024]))(errors='replace')
+        buf, rows = '', []
+        while True:
+            buf += decoder.decode(raw, final=not raw)
+            last = 0
+            for m in _STMTTRN.finditer(buf):
+                tags = {k.upper(): v.strip() for k, v in _OFX_TAG.findall(m.group(1))}
+                desc = " - ".join(v for v in (tags.get('NAME'), tags.get('MEMO')) if v)
+                rows.append({'date': tags.get('DTPOSTED', '')[:8], 'amount': tags.get('TRNAMT', ''), 'desc': desc})
+                last = m.end()
+            buf = buf[last:]
+            if len(rows) >= chunksize or (not raw and rows):
+                frame = pd.DataFrame(rows)
+                frame['date'] = pd.to_datetime(frame['date'], format='%Y%m%d', errors='coerce')
+                yield frame
+                rows = []
+            if not raw: break
+            raw = f.read(block)
+    finally:
+        if isinstance(source, str): f.close()
+
+# --- NORMALIZAÇÃO E DEDUPLICAÇÃO ---
+def _parse_dates(s, dayfirst):
+    # ISO primeiro; o que sobrar tenta DD/MM/AAAA (ou MM/DD/AAAA)
+    s = s.astype(str).str.strip()
+    dates = pd.to_datetime(s, format='ISO8601', errors='coerce')
+    rest = dates.isna() & (s != '')
+    if rest.any():
+        dates[rest] = pd.to_datetime(s[rest], format='%d/%m/%Y' if dayfirst else '%m/%d/%Y', errors='coerce')
+    return dates
+
+def normalize(chunk, account, category='Outros', status='Pago', dayfirst=True):
+    """Converte um bloco lido para o esquema de transação; sem coluna 'type', o sinal do valor decide."""
+    out = pd.DataFrame(index=chunk.index)
+    dates = chunk['date']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = _parse_dates(dates, dayfirst)
+    amount = pd.to_numeric(chunk['amount'], errors='coerce')
+    out['date'] = dates.dt.strftime('%Y-%m-%d')
+    if 'type' in chunk.columns:
+        out['type'] = chunk['type'].where(chunk['type'].isin(['Receita', 'Despesa']), np.where(amount < 0, 'Despesa', 'Receita'))
+    else:
+        out['type'] = np.where(amount < 0, 'Despesa', 'Receita')
+    out['amount'] = amount.abs().round(2)
+    for field, default in (('account', account), ('category', category), ('status', status)):
+        col = chunk[field] if field in chunk.columns else None
+        out[field] = default if col is None else col.mask(col.astype(str).str.strip() == '', default)
+    out['desc'] = chunk['desc'].fillna('').astype(str).str.strip() if 'desc' in chunk.columns else ''
+    return out[dates.notna() & amount.notna()].reset_index(drop=True)
+
+def row_hashes(df):
+    # Hash vetorizado de (data, valor, conta, descrição), no mesmo formato para o banco e para o arquivo
+    key = pd.DataFrame({
+        'date': df['date'].astype(str).str[:10],
+        'amount': pd.to_numeric(df['amount'], errors='coerce').fillna(0.0).abs().round(2),
+        'account': df['account'].fillna('').astype(str),
+        'desc': df['desc'].fillna('').astype(str),
+    })
+    return pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+def existing_hashes(email, chunksize=50000):
+    # Vetor ordenado de uint64 (8 bytes por transação já gravada)
+    parts = [row_hashes(pd.DataFrame(rows, columns=DEDUP_FIELDS))
+             for rows in storage.iter_transactions(email, columns=DEDUP_FIELDS, chunksize=chunksize)]
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+
+def archived_hashes(email, years):
+    # Mesmo formato, das linhas dos anos arquivados em 'years' (uma partição por vez)
+    from finsaas import archive  # só quem tem anos arquivados paga o import do pyarrow
+    parts = [row_hashes(df) for y in sorted(years)
+             for df in archive.iter_years(email, start=f"{y:04d}-01-01", end=f"{y:04d}-12-31")]
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+
+def _in_sorted(hashes, known):
+    if not len(known): return np.zeros(len(hashes), dtype=bool)
+    pos = np.searchsorted(known, hashes).clip(max=len(known) - 1)
+    return known[pos] == hashes
+
+def _records(df):
+    # Mais rápido que to_dict(orient='records') com colunas de texto do pandas
+    cols = list(df.columns)
+    return [{'id': None, **dict(zip(cols, row))} for row in zip(*(df[c].tolist() for c in cols))]
+
+@timed('importer.import_statement')
+def import_statement(email, chunks, account, write=None, **defaults):
+    """Importa blocos (de read_csv_chunks/read_ofx_chunks) gravando um lote por bloco.
+
+    Linhas que já existiam no banco antes da importação são ignoradas (também as dos anos
+    arquivados, lidos só quando o arquivo chega neles); linhas iguais
+    dentro do arquivo (duas compras idênticas no mesmo dia) entram todas. Devolve
+    {'read', 'inserted', 'duplicates', 'invalid'}.
+    """
+    write = write or (lambda records: storage.insert_transactions(email, records))
+    known = existing_hashes(email)
+    archived = {p['year'] for p in storage.archive_years(email)}
+    stats = {'read': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0}
+    for chunk in chunks:
+        stats['read'] += len(chunk)
+        df = normalize(chunk, account, **defaults)
+        stats['invalid'] += len(chunk) - len(df)
+        if df.empty: continue
+        years = archived.intersection(int(y) for y in df['date'].str[:4].unique())
+        if years:
+            known = np.union1d(known, archived_hashes(email, years))
+            archived -= years
+        fresh = ~_in_sorted(row_hashes(df), known)
+        stats['duplicates'] += int((~fresh).sum())
+        df = df[fresh]
+        if df.empty: continue
+        write(_records(df))
+        stats['inserted'] += len(df)
+    return stats
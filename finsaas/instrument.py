@@ -0,0 +1,165 @@
+import functools
+import io
+import json
+import os
+import threading
+import time
+
+# --- INSTRUMENTAÇÃO POR RERUN ---
+# Cada rerun do Streamlit roda numa thread; o Trace ativo fica em _local e os spans
+# abertos fora de um Trace (jobs, benchmarks) não custam nada além de um getattr.
+TRACE_LOG = os.environ.get('FINSAAS_TRACE_LOG')
+ADMINS = {e.strip() for e in os.environ.get('FINSAAS_ADMINS', '').split(',') if e.strip()}
+
+_local = threading.local()
+_sink_lock = threading.Lock()
+
+class Span:
+    def __init__(self, trace, name, attrs):
+        self.trace, self.name, self.attrs = trace, name, attrs
+        self.t0 = None
+
+    def start(self):
+        if self.trace is not None:
+            self.t0 = time.perf_counter()
+            self.depth = self.trace.depth
+            self.trace.depth += 1
+        return self
+
+    def stop(self):
+        if self.trace is None or self.t0 is None: return
+        t1 = time.perf_counter()
+        self.trace.depth -= 1
+        self.trace.spans.append({"name": self.name, "start_ms": (self.t0 - self.trace.t0) * 1000,
+                                 "ms": (t1 - self.t0) * 1000, "depth": self.depth, **self.attrs})
+        self.t0 = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class Trace:
+    def __init__(self, **meta):
+        self.meta = meta
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.payloads = {}
+        self.depth = 0
+
+    def to_dict(self, **extra):
+        return {"ts": self.ts, **self.meta, **extra, "total_ms": (time.perf_counter() - self.t0) * 1000,
+                "spans": sorted(self.spans, key=lambda s: s["start_ms"]), "payloads": self.payloads}
+
+def current():
+    return getattr(_local, 'trace', None)
+
+def span(name, **attrs):
+    return Span(current(), name, attrs)
+
+def timed(name):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def estimate_payload(obj):
+    # Tamanho aproximado do que vai para o navegador
+    if hasattr(obj, 'memory_usage'):
+        nbytes = obj.memory_usage(deep=True)
+        return int(nbytes.sum() if hasattr(nbytes, 'sum') else nbytes)
+    if hasattr(obj, 'to_json'): return len(obj.to_json())
+    return len(json.dumps(obj, default=str))
+
+def record_payload(name, obj):
+    trace = current()
+    if trace is not None:
+        trace.payloads[name] = trace.payloads.get(name, 0) + estimate_payload(obj)
+
+def write_jsonl(record, path=None):
+    path = path or TRACE_LOG
+    if not path: return
+    line = json.dumps(record, default=str, ensure_ascii=False)
+    with _sink_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(line + "\n")
+
+# --- CICLO DO RERUN ---
+def begin_rerun(state, enabled, **meta):
+    """Abre o Trace deste rerun. Um Trace anterior interrompido por st.rerun()/st.stop() é gravado agora."""
+    pending = state.get('_trace')
+    if pending is not None:
+        state['_trace_last'] = pending.to_dict(interrupted=True)
+        write_jsonl(state['_trace_last'])
+    trace = Trace(**meta) if enabled else None
+    state['_trace'] = trace
+    _local.trace = trace
+    return trace
+
+def end_rerun(state, **extra):
+    trace = state.get('_trace')
+    state['_trace'] = None
+    _local.trace = None
+    if trace is None: return None
+    record = trace.to_dict(interrupted=False, **extra)
+    state['_trace_last'] = record
+    write_jsonl(record)
+    return record
+
+# --- CAPTURA DE PERFIL (UM RERUN) ---
+# O tracemalloc é do processo inteiro: uma captura por vez, e ela inclui as alocações das
+# outras sessões no mesmo intervalo. Uma captura abandonada (sessão encerrada no meio)
+# libera a vez depois de PROFILE_TIMEOUT_S.
+PROFILE_TIMEOUT_S = 120
+_profile_lock = threading.Lock()
+_profiling = None
+
+class ProfilerBusy(RuntimeError):
+    """Já há uma captura de perfil em andamento neste processo."""
+
+class Profiler:
+    def __init__(self, top=25):
+        import cProfile
+        self.top = top
+        self.prof = cProfile.Profile()
+        self.t0 = None
+
+    def start(self):
+        global _profiling
+        import tracemalloc
+        with _profile_lock:
+            if _profiling is not None and time.monotonic() - _profiling.t0 > PROFILE_TIMEOUT_S:
+                _profiling._release()
+            if _profiling is not None or tracemalloc.is_tracing():
+                raise ProfilerBusy("outra captura de perfil em andamento")
+            tracemalloc.start()
+            self.t0 = time.monotonic()
+            _profiling = self
+        self.prof.enable()
+        return self
+
+    def _release(self):
+        # Chamado com _profile_lock
+        global _profiling
+        import tracemalloc
+        self.prof.disable()
+        tracemalloc.stop()
+        _profiling = None
+
+    def stop(self):
+        """Resultado da captura, ou None se ela expirou e outra tomou a vez."""
+        import pstats, tracemalloc
+        self.prof.disable()
+        with _profile_lock:
+            if _profiling is not self: return None
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            self._release()
+        out = io.StringIO()
+        pstats.Stats(self.prof, stream=out).sort_stats('cumulative').print_stats(self.top)
+        allocs = [str(s) for s in snapshot.statistics('lineno')[:15]]
+        return {"cprofile": out.getvalue(), "tracemalloc": allocs, "mem_current": current, "mem_peak": peak}
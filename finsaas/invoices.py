@@ -0,0 +1,91 @@
+"""Faturas e limite dos cartões, a partir do card_invoices do storage (sem ler o histórico).
+
+A fatura de competência M reúne as despesas do cartão do dia de fechamento de M-1
+até a véspera do fechamento de M (a mesma regra da competência em finance/storage).
+Ela fecha no closing_day de M e vence no due_day seguinte ao fechamento. Faturas que
+ainda não venceram ocupam o limite; as vencidas são tratadas como pagas.
+
+Recorrências no cartão (finsaas/recurrence.py) são expandidas só para as faturas
+mostradas. Um parcelamento já iniciado ocupa o limite com todas as parcelas; uma
+assinatura sem fim, só com as ocorrências que já aconteceram.
+"""
+import calendar
+from datetime import date
+from finsaas import storage
+
+def _day(year, month, day):
+    # Dia 31 num mês de 30 dias vira o último dia do mês
+    return date(year, month, min(max(int(day), 1), calendar.monthrange(year, month)[1]))
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+def closing_date(card, comp):
+    year, month = int(comp[:4]), int(comp[5:7])
+    closing = card.get('closing_day')
+    # Sem closing_day a competência é o mês corrido: fecha no dia 1 do mês seguinte
+    if storage.is_missing(closing): return date(*_next_month(year, month), 1)
+    return _day(year, month, storage.as_amount(closing))
+
+def due_date(card, comp):
+    closed = closing_date(card, comp)
+    due = storage.as_amount(card.get('due_day'))
+    if due <= 0: return closed
+    if due > closed.day: return _day(closed.year, closed.month, due)
+    return _day(*_next_month(closed.year, closed.month), due)
+
+def status(card, comp, today):
+    if today < closing_date(card, comp): return "Aberta"
+    return "Fechada" if today <= due_date(card, comp) else "Vencida"
+
+def _recurring(user_db, today, comps):
+    """{(cartão, competência): [despesas, créditos, parte que ocupa o limite]} das recorrências no cartão,
+    da fatura anterior à de hoje até a última parcela (ou até as competências pedidas em 'comps')."""
+    names = {c.get('name') for c in user_db.get('cards', [])}
+    rules = [r for r in user_db.get('recurrences', []) if r.get('account') in names]
+    if not rules: return {}
+    import pandas as pd
+    from finsaas import recurrence  # pandas só para quem tem recorrência no cartão
+    this = pd.Period(today, 'M')
+    ends = [d for d in (recurrence.last_date(r) for r in rules if recurrence.is_valid(r)) if d is not None]
+    first = min([this - 1, *(pd.Period(c, 'M') for c in comps)])
+    last = max([this + 1, *(pd.Period(c, 'M') for c in comps), *(pd.Period(d, 'M') + 1 for d in ends)])
+    occ = recurrence.expand(user_db, first, last)
+    finite = {r['id'] for r in rules if r.get('count') or r.get('until')}
+    out = {}
+    for row in occ.itertuples(index=False):
+        if row.account not in names or row.type not in ('Receita', 'Despesa'): continue
+        t = out.setdefault((row.account, row.competencia.strftime('%Y-%m')), [0.0, 0.0, 0.0])
+        sign = 1 if row.type == 'Despesa' else -1
+        t[0 if sign > 0 else 1] += row.amount
+        if row.rule_id in finite or row.date.date() <= today: t[2] += sign * row.amount
+    return out
+
+def statements(email, user_db, today=None, comps=()):
+    """Por cartão de user_db['cards']: faturas (com fechamento, vencimento e situação), limite usado e
+    disponível. 'comps' (AAAA-MM) garante as recorrências dessas competências além das em aberto."""
+    today = today or date.today()
+    by_card = {}
+    for inv in storage.card_invoices(email):
+        by_card.setdefault(inv['card'], {})[inv['comp']] = {**inv, 'committed': inv['total']}
+    for (name, comp), (charges, credits, committed) in _recurring(user_db, today, comps).items():
+        inv = by_card.setdefault(name, {}).setdefault(comp, {'card': name, 'comp': comp, 'charges': 0.0, 'credits': 0.0, 'committed': 0.0})
+        inv['charges'] += charges
+        inv['credits'] += credits
+        inv['committed'] += committed
+        inv['total'] = inv['charges'] - inv['credits']
+    out = []
+    for card in user_db.get('cards', []):
+        invoices = [{**inv, 'closing': closing_date(card, comp), 'due': due_date(card, comp), 'status': status(card, comp, today)}
+                    for comp, inv in sorted(by_card.get(card.get('name'), {}).items())]
+        limit = storage.as_amount(card.get('limit'))
+        used = sum(inv['committed'] for inv in invoices if inv['status'] != "Vencida")
+        out.append({'name': card.get('name'), 'limit': limit, 'used': used, 'available': limit - used,
+                    'utilization': used / limit if limit > 0 else None, 'invoices': invoices})
+    return out
+
+def invoice_for(statement, comp):
+    # Fatura do mês de competência 'comp' (YYYY-MM); None se o cartão não teve lançamentos nele
+    for inv in statement['invoices']:
+        if inv['comp'] == comp: return inv
+    return None
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from finsaas.finance import add_competence, prepare_transactions
+from finsaas.instrument import timed
+from finsaas.storage import TX_FIELDS, as_amount
+
+# --- RECORRÊNCIAS E PARCELAMENTOS ---
+# Uma regra (storage.recurrences) vale por uma série inteira: mensal ou semanal a partir
+# de 'start', até 'until' ou por 'count' parcelas (ou sem fim). As ocorrências nunca são
+# gravadas: são expandidas só para as datas que a tela/relatório pede. Editar ou cancelar
+# uma ocorrência grava apenas a exceção (storage.recurrence_overrides, pela posição n).
+FREQS = {"monthly": "Mensal", "weekly": "Semanal"}
+OCC_COLS = TX_FIELDS + ['rule_id', 'n']
+
+def _ts(value):
+    ts = pd.to_datetime(str(value)[:10], format='%Y-%m-%d', errors='coerce') if value else pd.NaT
+    return None if pd.isna(ts) else ts
+
+def occurrence_dates(rule, k):
+    """Datas das ocorrências de índices k (array). No mensal, dia 31 vira o último dia dos meses curtos."""
+    start, k = _ts(rule['start']), np.asarray(k, dtype='int64')
+    if rule['freq'] == 'weekly':
+        return pd.DatetimeIndex(start + pd.to_timedelta(7 * k, unit='D'))
+    per = start.year * 12 + start.month - 1 + k
+    first = pd.to_datetime(pd.DataFrame({'year': per // 12, 'month': per % 12 + 1, 'day': 1}))
+    day = np.minimum(start.day, first.dt.days_in_month.to_numpy())
+    return pd.DatetimeIndex(first + pd.to_timedelta(day - 1, unit='D'))
+
+def first_index(rule, when):
+    # Menor k >= 0 com data >= when (as datas da série são crescentes)
+    start = _ts(rule['start'])
+    if when <= start: return 0
+    if rule['freq'] == 'weekly': return int(-(-(when - start).days // 7))
+    k = max((when.year - start.year) * 12 + when.month - start.month - 1, 0)
+    while occurrence_dates(rule, [k])[0] < when: k += 1
+    return k
+
+def end_index(rule):
+    # Uma posição além da última ocorrência (None = sem fim)
+    if rule.get('count') is not None and rule['count'] == rule['count']: return max(int(rule['count']), 0)
+    until = _ts(rule.get('until'))
+    return first_index(rule, until + pd.Timedelta(days=1)) if until is not None else None
+
+def last_date(rule):
+    # Data da última ocorrência (None = sem fim ou série vazia)
+    stop = end_index(rule)
+    return occurrence_dates(rule, [stop - 1])[0] if stop else None
+
+def first_date(rule):
+    # Data da primeira ocorrência (None = regra inválida)
+    return _ts(rule.get('start'))
+
+def is_valid(rule):
+    return _ts(rule.get('start')) is not None and rule.get('freq') in FREQS
+
+def _overridden(user_db):
+    out = {}
+    for o in user_db.get('recurrence_overrides', []): out.setdefault(o['rule_id'], {})[int(o['n'])] = o
+    return out
+
+def _desc(rule, n):
+    # Parcelamentos ganham o "(k/N)" na descrição de cada ocorrência
+    desc = rule.get('desc') or ''
+    return f"{desc} ({n + 1}/{int(rule['count'])})".strip() if rule.get('count') else desc
+
+def _occurrence(rule, n, date):
+    return {'id': None, 'date': date, 'type': rule.get('type'), 'amount': as_amount(rule.get('amount')),
+            'account': rule.get('account'), 'category': rule.get('category'), 'status': rule.get('status'),
+            'desc': _desc(rule, n), 'rule_id': rule['id'], 'n': n}
+
+def _base_frame(user_db, a, b, skip):
+    """Ocorrências sem exceção com data em [a, b)."""
+    parts = []
+    for rule in user_db.get('recurrences', []):
+        if not is_valid(rule): continue
+        stop = end_index(rule)
+        lo, hi = first_index(rule, a), first_index(rule, b)
+        if stop is not None: hi = min(hi, stop)
+        ks = np.setdiff1d(np.arange(lo, max(hi, lo)), list(skip.get(rule['id'], ())))
+        if not len(ks): continue
+        occ = _occurrence(rule, 0, None)
+        df = pd.DataFrame({c: [occ[c]] * len(ks) for c in ('id', 'type', 'amount', 'account', 'category', 'status')})
+        df['date'] = occurrence_dates(rule, ks)
+        df['desc'] = [_desc(rule, int(k)) for k in ks]
+        df['rule_id'], df['n'] = rule['id'], ks
+        parts.append(df[OCC_COLS])
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=OCC_COLS)
+
+def _override_frame(user_db):
+    """Ocorrências com exceção (editadas), já com os valores novos. Canceladas ficam de fora."""
+    rules = {r['id']: r for r in user_db.get('recurrences', []) if is_valid(r)}
+    rows = []
+    for rule_id, by_n in _overridden(user_db).items():
+        rule = rules.get(rule_id)
+        if rule is None: continue
+        stop = end_index(rule)
+        for n, o in by_n.items():
+            if o.get('cancelled') or n < 0 or (stop is not None and n >= stop): continue
+            occ = _occurrence(rule, n, _ts(o.get('date')) or occurrence_dates(rule, [n])[0])
+            for k in ('amount', 'status', 'desc'):
+                if o.get(k) is not None: occ[k] = as_amount(o[k]) if k == 'amount' else o[k]
+            rows.append(occ)
+    return pd.DataFrame(rows, columns=OCC_COLS)
+
+def _prepared(frames, cards):
+    frames = [f for f in frames if not f.empty]
+    if not frames: return prepare_transactions({})
+    df = pd.concat(frames, ignore_index=True).astype({'amount': 'float64'})
+    df['date'] = pd.to_datetime(df['date']).astype('datetime64[us]')
+    return add_competence(df, cards)
+
+@timed('recurrence.expand')
+def expand(user_db, first_month, last_month):
+    """Ocorrências cuja competência cai entre first_month e last_month (inclusive), no formato do prepare_transactions."""
+    first, last = pd.Period(first_month, 'M'), pd.Period(last_month, 'M')
+    a, b = (first - 1).start_time, (last + 1).start_time  # a competência puxa no máximo um mês
+    df = _prepared([_base_frame(user_db, a, b, _overridden(user_db)), _override_frame(user_db)], user_db.get('cards', []))
+    if df.empty: return df
+    comp = df['competencia'].dt.to_period('M')
+    return df[(comp >= first) & (comp <= last)].sort_values('date', kind='stable').reset_index(drop=True)
+
+@timed('recurrence.balance_before')
+def balance_before(user_db, month, status='Pago'):
+    """Saldo das ocorrências (pagas, ou com outro 'status') com competência anterior ao mês, sem expandir a série inteira."""
+    month = pd.Period(month, 'M')
+    a, b = (month - 1).start_time, month.start_time
+    skip = _overridden(user_db)
+    total = 0.0
+    # Datas antes de M-1: competência com certeza anterior a M, basta contar as ocorrências
+    for rule in user_db.get('recurrences', []):
+        if not is_valid(rule) or rule.get('status') != status or rule.get('type') not in ('Receita', 'Despesa'): continue
+        stop = end_index(rule)
+        hi = first_index(rule, a) if stop is None else min(first_index(rule, a), stop)
+        n = hi - sum(1 for k in skip.get(rule['id'], ()) if 0 <= k < hi)
+        total += n * as_amount(rule.get('amount')) * (1 if rule['type'] == 'Receita' else -1)
+    # Fronteira (datas em M-1, que o cartão pode jogar para M) e as ocorrências editadas
+    df = _prepared([_base_frame(user_db, a, b, skip), _override_frame(user_db)], user_db.get('cards', []))
+    if df.empty: return total
+    df = df[(df['competencia'] < b) & (df['status'] == status)]
+    return total + df.loc[df['type'] == 'Receita', 'amount'].sum() - df.loc[df['type'] == 'Despesa', 'amount'].sum()
+
+def month(user_db, selected_date):
+    """Ocorrências do mês e o saldo pago das anteriores (o que o Dashboard soma ao índice mensal)."""
+    return expand(user_db, selected_date, selected_date), balance_before(user_db, selected_date)
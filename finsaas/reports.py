@@ -0,0 +1,86 @@
+"""Relatórios mensais de todos os usuários, fora da interface.
+
+Os usuários são divididos em lotes e cada lote roda num processo do pool, com a
+mesma lógica de mês do app (finance.prepare_transactions + monthly_summary).
+
+Uso:
+    python -m finsaas.reports --start 2023-01 --end 2023-12 --out relatorios
+    python -m finsaas.reports --format parquet --workers 8 --chunk 200
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import pandas as pd
+from finsaas import archive, finance, storage
+from finsaas.export import ChunkWriter
+
+SUMMARY_COLS = ['user', 'mes', 'saldo_inicial', 'receitas', 'despesas', 'balanco', 'saldo_final']
+CATEGORY_COLS = ['user', 'mes', 'type', 'category', 'amount']
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# --- TRABALHO DE UM LOTE (RODA NO PROCESSO FILHO) ---
+def user_report(user_db, months):
+    # Recorrências: só as ocorrências do período; as anteriores entram no saldo inicial
+    df, carry, _ = finance.period_frame(user_db, finance.prepare_transactions(user_db), months)
+    return finance.monthly_summary(df, months, carry), finance.category_totals(df, months)
+
+def report_chunk(db_path, emails, start, end):
+    storage.set_db_path(db_path)
+    months = finance.month_range(start, end)
+    summaries, categories = [], []
+    for email in emails:
+        # Só lê os anos arquivados que o período alcança; o resto entra pelo saldo acumulado
+        summary, cats = user_report(archive.load_user_data(email, archive.first_year(months[0].start_time)), months)
+        summary.insert(0, 'user', email)
+        cats.insert(0, 'user', email)
+        summaries.append(summary)
+        if not cats.empty: categories.append(cats)
+    summary = pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame(columns=SUMMARY_COLS)
+    cats = pd.concat(categories, ignore_index=True) if categories else pd.DataFrame(columns=CATEGORY_COLS)
+    return summary[SUMMARY_COLS], cats[CATEGORY_COLS].astype({'amount': 'float64'})
+
+def run(db_path, start, end, out_dir, fmt='csv', workers=None, chunk=100):
+    """Gera resumo.<fmt> e categorias.<fmt> em out_dir para todos os usuários. Devolve estatísticas."""
+    t0 = time.perf_counter()
+    conn = storage.connect(db_path)
+    try: emails = storage.list_users(conn)
+    finally: conn.close()
+    os.makedirs(out_dir, exist_ok=True)
+    summary_out = ChunkWriter(os.path.join(out_dir, f"resumo.{fmt}"), fmt)
+    category_out = ChunkWriter(os.path.join(out_dir, f"categorias.{fmt}"), fmt)
+    batches = list(chunked(emails, chunk))
+    args = ([db_path] * len(batches), batches, [start] * len(batches), [end] * len(batches))
+    # workers=1 roda no próprio processo (útil para depurar e como referência nos benchmarks)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        results = pool.map(report_chunk, *args) if pool else map(report_chunk, *args)
+        for summary, cats in results:
+            summary_out.write(summary)
+            category_out.write(cats)
+    finally:
+        summary_out.close()
+        category_out.close()
+        if pool: pool.shutdown()
+    elapsed = time.perf_counter() - t0
+    return {"users": len(emails), "batches": len(batches), "summary_rows": summary_out.rows,
+            "category_rows": category_out.rows, "seconds": elapsed}
+
+if __name__ == "__main__":
+    this_month = date.today().strftime("%Y-%m")
+    parser = argparse.ArgumentParser(description="Gera os relatórios mensais de todos os usuários.")
+    parser.add_argument("--db", default=storage.DB_PATH)
+    parser.add_argument("--start", default=this_month, help="primeiro mês (AAAA-MM)")
+    parser.add_argument("--end", help="último mês (AAAA-MM); padrão: o mesmo do início")
+    parser.add_argument("--out", default="relatorios", help="pasta de saída")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="processos (padrão: um por núcleo)")
+    parser.add_argument("--chunk", type=int, default=100, help="usuários por lote")
+    args = parser.parse_args()
+    stats = run(args.db, args.start, args.end or args.start, args.out, args.format, args.workers, args.chunk)
+    print(f"{stats['users']} usuários em {stats['batches']} lotes, {stats['seconds']:.2f} s "
+          f"({stats['users'] / max(stats['seconds'], 1e-9):.0f} usuários/s) -> {args.out}")
@@ -0,0 +1,668 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from finsaas.instrument import span, timed
+from finsaas.utils import safe_float
+
+# --- CONFIGURAÇÃO ---
+DB_PATH = os.environ.get('FINSAAS_DB', 'finsaas.db')
+LEGACY_JSON = 'finsaas_secure_db.json'
+
+TX_FIELDS = ['id', 'date', 'type', 'amount', 'account', 'category', 'status', 'desc']
+CARD_FIELDS = ['name', 'limit', 'closing_day', 'due_day']
+GOAL_FIELDS = ['name', 'target', 'current', 'color']
+RULE_FIELDS = ['id', 'start', 'freq', 'until', 'count', 'type', 'amount', 'account', 'category', 'status', 'desc']
+OVERRIDE_FIELDS = ['rule_id', 'n', 'cancelled', 'date', 'amount', 'status', 'desc']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY, name TEXT, password TEXT, version INTEGER NOT NULL DEFAULT 0,
+    next_id INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    rid INTEGER PRIMARY KEY, user TEXT NOT NULL, id INTEGER, date TEXT, type TEXT,
+    amount REAL, account TEXT, category TEXT, status TEXT, "desc" TEXT, comp TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_tx_user_date ON transactions(user, date);
+CREATE INDEX IF NOT EXISTS ix_tx_user_comp ON transactions(user, comp);
+CREATE INDEX IF NOT EXISTS ix_tx_user_id ON transactions(user, id);
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    user TEXT NOT NULL, comp TEXT NOT NULL,
+    rec_paid REAL NOT NULL DEFAULT 0, desp_paid REAL NOT NULL DEFAULT 0,
+    rec_pend REAL NOT NULL DEFAULT 0, desp_pend REAL NOT NULL DEFAULT 0,
+    balance REAL NOT NULL DEFAULT 0, PRIMARY KEY (user, comp)
+);
+CREATE TABLE IF NOT EXISTS card_invoices (
+    user TEXT NOT NULL, card TEXT NOT NULL, comp TEXT NOT NULL,
+    charges REAL NOT NULL DEFAULT 0, credits REAL NOT NULL DEFAULT 0, PRIMARY KEY (user, card, comp)
+);
+CREATE TABLE IF NOT EXISTS recurrences (
+    user TEXT NOT NULL, id INTEGER NOT NULL, start TEXT NOT NULL, freq TEXT NOT NULL, until TEXT, count INTEGER,
+    type TEXT, amount REAL, account TEXT, category TEXT, status TEXT, "desc" TEXT, PRIMARY KEY (user, id)
+);
+CREATE TABLE IF NOT EXISTS recurrence_overrides (
+    user TEXT NOT NULL, rule_id INTEGER NOT NULL, n INTEGER NOT NULL, cancelled INTEGER NOT NULL DEFAULT 0,
+    date TEXT, amount REAL, status TEXT, "desc" TEXT, PRIMARY KEY (user, rule_id, n)
+);
+CREATE TABLE IF NOT EXISTS archives (
+    user TEXT NOT NULL, year INTEGER NOT NULL, path TEXT NOT NULL, rows INTEGER NOT NULL,
+    paid_balance REAL NOT NULL, closing_balance REAL NOT NULL, PRIMARY KEY (user, year)
+);
+CREATE TABLE IF NOT EXISTS archive_totals (
+    user TEXT NOT NULL, comp TEXT NOT NULL,
+    rec_paid REAL NOT NULL DEFAULT 0, desp_paid REAL NOT NULL DEFAULT 0,
+    rec_pend REAL NOT NULL DEFAULT 0, desp_pend REAL NOT NULL DEFAULT 0, PRIMARY KEY (user, comp)
+);
+CREATE TABLE IF NOT EXISTS cards (
+    user TEXT NOT NULL, pos INTEGER NOT NULL, name TEXT, "limit" NUMERIC,
+    closing_day NUMERIC, due_day NUMERIC, PRIMARY KEY (user, pos)
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    user TEXT NOT NULL, pos INTEGER NOT NULL, name TEXT, PRIMARY KEY (user, pos)
+);
+CREATE TABLE IF NOT EXISTS goals (
+    user TEXT NOT NULL, pos INTEGER NOT NULL, name TEXT, target NUMERIC,
+    current NUMERIC, color TEXT, PRIMARY KEY (user, pos)
+);
+"""
+
+_local = threading.local()
+_inherited = []  # conexões herdadas por fork, nunca usadas
+
+class ConflictError(Exception):
+    """Os dados do usuário mudaram depois da versão lida pela sessão."""
+
+def _q(col):
+    # "desc" e "limit" são palavras reservadas do SQL
+    return f'"{col}"'
+
+def set_db_path(path):
+    global DB_PATH
+    DB_PATH = path
+
+def connect(path=None):
+    conn = sqlite3.connect(path or DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    user_cols = [r['name'] for r in conn.execute("PRAGMA table_info(users)")]
+    if 'version' not in user_cols:
+        conn.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    if 'next_id' not in user_cols:
+        conn.execute("ALTER TABLE users ADD COLUMN next_id INTEGER NOT NULL DEFAULT 0")
+    return conn
+
+def _conn():
+    # Uma conexão por thread (cada sessão do Streamlit roda na sua própria thread). Um processo
+    # filho criado por fork (finsaas.reports) não pode usar a conexão herdada: abre a sua
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'pid', None) != os.getpid():
+        # Nem fechar: o close no filho poderia fazer checkpoint do WAL do pai
+        _inherited.append(conn)
+        conn = None
+    if conn is None or getattr(_local, 'path', None) != DB_PATH:
+        conn = connect()
+        _local.conn, _local.path, _local.pid = conn, DB_PATH, os.getpid()
+    return conn
+
+def connection():
+    """Conexão desta thread (a mesma das funções deste módulo), para jobs e módulos do núcleo."""
+    return _conn()
+
+def bump_version(conn, email):
+    conn.execute("UPDATE users SET version = version + 1 WHERE email = ?", (email,))
+
+def check_version(conn, email, expected):
+    if expected is None: return
+    row = conn.execute("SELECT version FROM users WHERE email = ?", (email,)).fetchone()
+    current = row['version'] if row else 0
+    if current != expected:
+        raise ConflictError(f"versão {current} no banco, sessão leu a {expected}")
+
+@contextmanager
+def write_tx(email=None, conn=None):
+    # Toda escrita de um usuário incrementa a sua versão (usada como chave de cache)
+    conn = conn or _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        if email is not None: bump_version(conn, email)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+# --- COMPETÊNCIA (MÊS DA FATURA) ---
+def closing_days(cards):
+    return {c.get('name'): c.get('closing_day') for c in cards if c.get('name') is not None}
+
+def competence_key(tx, closing):
+    # Mesma regra do get_competence: despesa no cartão a partir do fechamento cai no mês seguinte
+    s = str(tx.get('date'))[:10]
+    try:
+        if len(s) == 10 and s[4] == s[7] == '-': d = date(int(s[:4]), int(s[5:7]), int(s[8:10]))
+        else: d = datetime.strptime(s, "%Y-%m-%d")
+    except ValueError: return None
+    y, m = d.year, d.month
+    # Fechamento em branco (NULL no banco: NaN do editor ou null do JSON antigo) não desloca (ver finance.card_closing_map)
+    closing_day = closing.get(tx.get('account')) if tx.get('type') == 'Despesa' else None
+    if not is_missing(closing_day) and d.day >= safe_float(closing_day):
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return f"{y:04d}-{m:02d}"
+
+# --- INICIALIZAÇÃO E MIGRAÇÃO ---
+def init_db(path=None, legacy_json=LEGACY_JSON):
+    path = path or DB_PATH
+    fresh = not os.path.exists(path)
+    conn = connect(path)
+    if fresh and legacy_json and os.path.exists(legacy_json):
+        migrate_json(legacy_json, conn)
+    elif not conn.execute("SELECT 1 FROM monthly_totals LIMIT 1").fetchone():
+        # Bancos criados antes do índice mensal
+        with write_tx(conn=conn):
+            for r in conn.execute("SELECT DISTINCT user FROM transactions").fetchall():
+                _rebuild_totals(conn, r['user'])
+    if not conn.execute("SELECT 1 FROM card_invoices LIMIT 1").fetchone():
+        # Bancos criados antes das faturas por cartão
+        with write_tx(conn=conn):
+            for r in conn.execute("SELECT DISTINCT user FROM cards").fetchall():
+                _rebuild_invoices(conn, r['user'])
+    if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+        # Cartões com fechamento em branco tinham as despesas jogadas para o mês seguinte
+        with write_tx(conn=conn):
+            for r in conn.execute("SELECT DISTINCT user FROM cards WHERE closing_day IS NULL").fetchall():
+                _recompute_comp(conn, r['user'])
+                _rebuild_invoices(conn, r['user'])
+        conn.execute("PRAGMA user_version = 1")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < 2:
+        # Contador de ids (users.next_id): começa depois do maior id já usado, inclusive nos anos arquivados
+        with write_tx(conn=conn):
+            for r in conn.execute("SELECT email FROM users").fetchall():
+                top = None
+                if archive_years(r['email'], conn):
+                    from finsaas import archive
+                    top = max((i for i in archive.read_years(r['email'], conn=conn)['id'] if not is_missing(i)), default=None)
+                reserve_ids(conn, r['email'], top)
+        conn.execute("PRAGMA user_version = 2")
+    with write_tx(conn=conn):
+        _dedupe_ids(conn)
+    conn.close()
+
+def migrate_json(json_path, conn=None):
+    """Importa o layout antigo ({"users": {...}, "data": {...}}) numa só transação."""
+    with open(json_path, 'r') as f: legacy = json.load(f)
+    conn = conn or _conn()
+    users = legacy.get('users', {})
+    data = legacy.get('data', {})
+    with write_tx(conn=conn):
+        conn.executemany("INSERT OR REPLACE INTO users (email, name, password) VALUES (?, ?, ?)",
+                         [(e, u.get('name'), u.get('password')) for e, u in users.items()])
+        for email, user_data in data.items():
+            _replace_user_data(conn, email, user_data)
+    return len(users), sum(len(d.get('transactions', [])) for d in data.values())
+
+# --- USUÁRIOS ---
+def list_users(conn=None):
+    conn = conn or _conn()
+    return [r['email'] for r in conn.execute("SELECT email FROM users ORDER BY email")]
+
+def get_user(email):
+    row = _conn().execute("SELECT email, name, password FROM users WHERE email = ?", (email,)).fetchone()
+    return dict(row) if row else None
+
+def authenticate(email, password):
+    user = get_user(email)
+    return user if user and user['password'] == password else None
+
+@timed('storage.get_version')
+def get_version(email):
+    row = _conn().execute("SELECT version FROM users WHERE email = ?", (email,)).fetchone()
+    return row['version'] if row else 0
+
+def create_user(email, name, password, accounts=("Carteira",)):
+    with write_tx() as conn:
+        if conn.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone(): return False
+        conn.execute("INSERT INTO users (email, name, password) VALUES (?, ?, ?)", (email, name, password))
+        _write_accounts(conn, email, list(accounts))
+    return True
+
+# --- LEITURA ---
+def _rows(conn, table, fields, email):
+    cols = ", ".join(_q(c) for c in fields)
+    return [dict(r) for r in conn.execute(f"SELECT {cols} FROM {table} WHERE user = ? ORDER BY pos", (email,))]
+
+def load_cards(email, conn=None):
+    return _rows(conn or _conn(), 'cards', CARD_FIELDS, email)
+
+def card_closing(email, conn=None):
+    # {cartão: closing_day}, como gravado (None = em branco)
+    return _card_closing(conn or _conn(), email)
+
+def load_transactions(email, conn=None):
+    conn = conn or _conn()
+    cols = ", ".join(_q(c) for c in TX_FIELDS)
+    return [dict(r) for r in conn.execute(f"SELECT {cols} FROM transactions WHERE user = ? ORDER BY rid", (email,))]
+
+def load_transaction_columns(email, conn=None):
+    # {campo: lista}, sem montar um dict por linha (entrada do columnar.TxStore)
+    conn = conn or _conn()
+    cols = ", ".join(_q(c) for c in TX_FIELDS)
+    cur = conn.cursor()
+    cur.row_factory = None  # tuplas simples: bem mais rápido que sqlite3.Row
+    rows = cur.execute(f"SELECT {cols} FROM transactions WHERE user = ? ORDER BY rid", (email,)).fetchall()
+    values = list(zip(*rows)) if rows else [()] * len(TX_FIELDS)
+    return {f: list(v) for f, v in zip(TX_FIELDS, values)}
+
+@timed('storage.load_user_data')
+def load_user_data(email, tx_columns=False):
+    conn = _conn()
+    conn.execute("BEGIN")
+    try:
+        return {
+            "transactions": (load_transaction_columns if tx_columns else load_transactions)(email, conn),
+            "cards": _rows(conn, 'cards', CARD_FIELDS, email),
+            "accounts": [r['name'] for r in _rows(conn, 'accounts', ['name'], email)],
+            "goals": _rows(conn, 'goals', GOAL_FIELDS, email),
+            **load_recurrences(email, conn),
+        }
+    finally:
+        conn.execute("COMMIT")
+
+def load_recurrences(email, conn=None):
+    # Regras de recorrência/parcelamento e as ocorrências editadas (finsaas/recurrence.py expande)
+    conn = conn or _conn()
+    rules = conn.execute(f"SELECT {', '.join(_q(c) for c in RULE_FIELDS)} FROM recurrences WHERE user = ? ORDER BY id", (email,))
+    overrides = conn.execute(f"SELECT {', '.join(_q(c) for c in OVERRIDE_FIELDS)} FROM recurrence_overrides WHERE user = ? "
+                             "ORDER BY rule_id, n", (email,))
+    return {"recurrences": [dict(r) for r in rules], "recurrence_overrides": [dict(r) for r in overrides]}
+
+def _tx_filter(email, start=None, end=None, accounts=None, categories=None, statuses=None):
+    where, params = ["user = ?"], [email]
+    if start is not None: where.append("date >= ?"); params.append(str(start)[:10])
+    if end is not None: where.append("date <= ?"); params.append(str(end)[:10])
+    for col, values in (('account', accounts), ('category', categories), ('status', statuses)):
+        if values:
+            where.append(f"{col} IN ({', '.join('?' * len(values))})"); params.extend(values)
+    return " AND ".join(where), params
+
+@timed('storage.query_transactions')
+def query_transactions(email, limit=None, offset=0, **filters):
+    # Janela do Extrato: mais recentes primeiro, como o antigo sort_values('date', ascending=False)
+    where, params = _tx_filter(email, **filters)
+    cols = ", ".join(_q(c) for c in TX_FIELDS)
+    sql = f"SELECT {cols} FROM transactions WHERE {where} ORDER BY date DESC, rid DESC"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"; params += [int(limit), int(offset)]
+    return [dict(r) for r in _conn().execute(sql, params)]
+
+def iter_transactions(email, columns=TX_FIELDS, chunksize=10000, **filters):
+    # Lê em blocos de 'chunksize' linhas (ordem cronológica) sem montar o histórico inteiro na memória
+    where, params = _tx_filter(email, **filters)
+    cols = ", ".join(_q(c) for c in columns)
+    cur = connect().execute(f"SELECT {cols} FROM transactions WHERE {where} ORDER BY date, rid", params)
+    try:
+        while True:
+            rows = cur.fetchmany(chunksize)
+            if not rows: break
+            yield [dict(r) for r in rows]
+    finally:
+        cur.connection.close()
+
+@timed('storage.count_transactions')
+def count_transactions(email, **filters):
+    where, params = _tx_filter(email, **filters)
+    return _conn().execute(f"SELECT COUNT(*) FROM transactions WHERE {where}", params).fetchone()[0]
+
+# --- ÍNDICE MENSAL (SALDOS POR COMPETÊNCIA) ---
+# monthly_totals guarda, por (usuário, mês de competência), receitas/despesas pagas e
+# pendentes e o saldo pago acumulado até o fim do mês. É mantido junto com cada escrita.
+def _comp_of(year, month):
+    return f"{int(year):04d}-{int(month):02d}"
+
+def as_amount(val):
+    # NaN vira 0, como no sum() do pandas
+    val = safe_float(val)
+    return 0.0 if val != val else val
+
+def totals_deltas(rows, sign=1, deltas=None):
+    # rows: (comp, type, status, amount)
+    deltas = {} if deltas is None else deltas
+    for comp, tp, status, amount in rows:
+        if comp is None or tp not in ('Receita', 'Despesa'): continue
+        d = deltas.setdefault(comp, [0.0, 0.0, 0.0, 0.0])
+        d[(0 if tp == 'Receita' else 1) + (0 if status == 'Pago' else 2)] += sign * as_amount(amount)
+    return deltas
+
+def _apply_totals(conn, email, deltas):
+    for comp in sorted(deltas):
+        rp, dp, rn, dn = deltas[comp]
+        conn.execute("""INSERT OR IGNORE INTO monthly_totals (user, comp, balance) VALUES (?, ?, COALESCE(
+            (SELECT balance FROM monthly_totals WHERE user = ? AND comp < ? ORDER BY comp DESC LIMIT 1), 0))""",
+                     (email, comp, email, comp))
+        conn.execute("""UPDATE monthly_totals SET rec_paid = rec_paid + ?, desp_paid = desp_paid + ?,
+            rec_pend = rec_pend + ?, desp_pend = desp_pend + ? WHERE user = ? AND comp = ?""",
+                     (rp, dp, rn, dn, email, comp))
+        if rp != dp:
+            conn.execute("UPDATE monthly_totals SET balance = balance + ? WHERE user = ? AND comp >= ?",
+                         (rp - dp, email, comp))
+
+def _rebuild_totals(conn, email):
+    # Anos arquivados (finsaas/archive.py) entram pelos totais guardados em archive_totals
+    conn.execute("DELETE FROM monthly_totals WHERE user = ?", (email,))
+    conn.execute("""
+        INSERT INTO monthly_totals (user, comp, rec_paid, desp_paid, rec_pend, desp_pend, balance)
+        SELECT ?, comp, SUM(rp), SUM(dp), SUM(rn), SUM(dn), SUM(SUM(rp - dp)) OVER (ORDER BY comp) FROM (
+            SELECT comp,
+                SUM(CASE WHEN type = 'Receita' AND status = 'Pago' THEN amt ELSE 0 END) AS rp,
+                SUM(CASE WHEN type = 'Despesa' AND status = 'Pago' THEN amt ELSE 0 END) AS dp,
+                SUM(CASE WHEN type = 'Receita' AND status IS NOT 'Pago' THEN amt ELSE 0 END) AS rn,
+                SUM(CASE WHEN type = 'Despesa' AND status IS NOT 'Pago' THEN amt ELSE 0 END) AS dn
+            FROM (SELECT comp, type, status,
+                         CASE WHEN typeof(amount) IN ('integer', 'real') THEN amount ELSE 0.0 END AS amt
+                  FROM transactions WHERE user = ? AND comp IS NOT NULL AND type IN ('Receita', 'Despesa'))
+            GROUP BY comp
+            UNION ALL
+            SELECT comp, rec_paid, desp_paid, rec_pend, desp_pend FROM archive_totals WHERE user = ?)
+        GROUP BY comp""", (email, email, email))
+
+@timed('storage.opening_balance')
+def opening_balance(email, year, month):
+    # Saldo pago acumulado de todas as competências anteriores ao mês
+    row = _conn().execute("SELECT balance FROM monthly_totals WHERE user = ? AND comp < ? ORDER BY comp DESC LIMIT 1",
+                          (email, _comp_of(year, month))).fetchone()
+    return row['balance'] if row else 0.0
+
+@timed('storage.month_totals')
+def month_totals(email, year, month):
+    row = _conn().execute("SELECT rec_paid, desp_paid, rec_pend, desp_pend FROM monthly_totals WHERE user = ? AND comp = ?",
+                          (email, _comp_of(year, month))).fetchone()
+    t = dict(row) if row else {"rec_paid": 0.0, "desp_paid": 0.0, "rec_pend": 0.0, "desp_pend": 0.0}
+    t['rec'] = t['rec_paid'] + t['rec_pend']
+    t['desp'] = t['desp_paid'] + t['desp_pend']
+    return t
+
+# --- FATURAS DOS CARTÕES ---
+# card_invoices guarda, por (usuário, cartão, mês de competência), as despesas lançadas no
+# cartão (charges) e os créditos/estornos (credits). Como o monthly_totals, é ajustado a cada
+# escrita; só é recalculado inteiro quando o fechamento de um cartão muda.
+def _invoice_deltas(rows, cards, sign=1, deltas=None):
+    # rows: (account, comp, type, amount); só contas que são cartões
+    deltas = {} if deltas is None else deltas
+    for account, comp, tp, amount in rows:
+        if comp is None or account not in cards or tp not in ('Receita', 'Despesa'): continue
+        d = deltas.setdefault((account, comp), [0.0, 0.0])
+        d[0 if tp == 'Despesa' else 1] += sign * as_amount(amount)
+    return deltas
+
+def _apply_invoices(conn, email, deltas):
+    for (card, comp), (charges, credits) in deltas.items():
+        conn.execute("INSERT OR IGNORE INTO card_invoices (user, card, comp) VALUES (?, ?, ?)", (email, card, comp))
+        conn.execute("UPDATE card_invoices SET charges = charges + ?, credits = credits + ? WHERE user = ? AND card = ? AND comp = ?",
+                     (charges, credits, email, card, comp))
+
+def _rebuild_invoices(conn, email):
+    conn.execute("DELETE FROM card_invoices WHERE user = ?", (email,))
+    conn.execute("""
+        INSERT INTO card_invoices (user, card, comp, charges, credits)
+        SELECT t.user, t.account, t.comp,
+            SUM(CASE WHEN t.type = 'Despesa' THEN t.amt ELSE 0 END), SUM(CASE WHEN t.type = 'Receita' THEN t.amt ELSE 0 END)
+        FROM (SELECT user, account, comp, type,
+                     CASE WHEN typeof(amount) IN ('integer', 'real') THEN amount ELSE 0.0 END AS amt
+              FROM transactions WHERE user = ? AND comp IS NOT NULL AND type IN ('Receita', 'Despesa')) t
+        WHERE t.account IN (SELECT name FROM cards WHERE user = ?)
+        GROUP BY t.account, t.comp""", (email, email))
+    if archive_years(email, conn):
+        # Linhas arquivadas, com a competência dos fechamentos atuais
+        from finsaas import archive
+        closing = _card_closing(conn, email)
+        rows = archive.row_dicts(archive.read_years(email, conn=conn))
+        _apply_invoices(conn, email, _invoice_deltas(((r['account'], competence_key(r, closing), r['type'], r['amount'])
+                                                      for r in rows), closing))
+
+def rebuild_indexes(conn, email):
+    # monthly_totals e card_invoices refeitos do zero (os ajustes incrementais devem chegar no mesmo)
+    _rebuild_totals(conn, email)
+    _rebuild_invoices(conn, email)
+
+@timed('storage.card_invoices')
+def card_invoices(email, card=None):
+    # Faturas por competência (mais antigas primeiro); total = despesas - créditos
+    sql, params = "SELECT card, comp, charges, credits FROM card_invoices WHERE user = ?", [email]
+    if card is not None: sql += " AND card = ?"; params.append(card)
+    rows = [dict(r) for r in _conn().execute(sql + " ORDER BY card, comp", params)]
+    for r in rows: r['total'] = r['charges'] - r['credits']
+    return rows
+
+# --- ANOS ARQUIVADOS (PARTIÇÕES FRIAS) ---
+# As partições em si (Parquet por usuário e ano) ficam em finsaas/archive.py; aqui só o catálogo.
+def archive_years(email, conn=None):
+    conn = conn or _conn()
+    return [dict(r) for r in conn.execute("SELECT year, path, rows, paid_balance, closing_balance FROM archives "
+                                          "WHERE user = ? ORDER BY year", (email,))]
+
+def archive_cutoff(email, conn=None):
+    # Primeiro ano quente (tudo com data anterior está arquivado); None sem arquivo
+    row = (conn or _conn()).execute("SELECT MAX(year) FROM archives WHERE user = ?", (email,)).fetchone()
+    return row[0] + 1 if row[0] is not None else None
+
+# --- ESCRITA ---
+def _tx_row(email, tx, closing):
+    return (email, *[tx.get(k) for k in TX_FIELDS], competence_key(tx, closing))
+
+def _insert_txs(conn, email, txs, closing, totals=True):
+    cols = ", ".join(_q(c) for c in ['user', *TX_FIELDS, 'comp'])
+    marks = ", ".join("?" * (len(TX_FIELDS) + 2))
+    rows = [_tx_row(email, t, closing) for t in txs]
+    conn.executemany(f"INSERT INTO transactions ({cols}) VALUES ({marks})", rows)
+    if totals:
+        i_type, i_status, i_amount, i_account = (1 + TX_FIELDS.index(k) for k in ('type', 'status', 'amount', 'account'))
+        _apply_totals(conn, email, totals_deltas((r[-1], r[i_type], r[i_status], r[i_amount]) for r in rows))
+        _apply_invoices(conn, email, _invoice_deltas(((r[i_account], r[-1], r[i_type], r[i_amount]) for r in rows), closing))
+
+def is_missing(val):
+    return val is None or (isinstance(val, float) and val != val)
+
+def reserve_ids(conn, email, top=None):
+    """Garante que o contador de ids do usuário passa do maior id vivo (e de 'top'). Devolve o próximo id.
+
+    O contador só cresce: o id de uma linha excluída ou arquivada nunca é reaproveitado, porque as
+    gravações parciais (o Extrato de outra sessão, por exemplo) casam as linhas pelo id."""
+    live = conn.execute("SELECT MAX(id) FROM transactions WHERE user = ?", (email,)).fetchone()[0]
+    floor = max(live or 0, top or 0) + 1
+    conn.execute("UPDATE users SET next_id = MAX(next_id, ?) WHERE email = ?", (floor, email))
+    row = conn.execute("SELECT next_id FROM users WHERE email = ?", (email,)).fetchone()
+    return row['next_id'] if row else floor
+
+def _assign_ids(conn, email, txs):
+    # Ids vazios ou já entregues (mesmo de linhas excluídas) recebem o próximo do contador
+    next_id = reserve_ids(conn, email)
+    for tx in txs:
+        tid = tx.get('id')
+        tx['id'] = int(tid) if not is_missing(tid) and int(tid) >= next_id else next_id
+        next_id = tx['id'] + 1
+    conn.execute("UPDATE users SET next_id = ? WHERE email = ?", (next_id, email))
+    return txs
+
+def _dedupe_ids(conn, email=None):
+    scope, params = ("AND t.user = ?", [email]) if email is not None else ("", [])
+    dupes = conn.execute(f"""SELECT rid, user FROM transactions t WHERE (id IS NULL OR EXISTS (
+        SELECT 1 FROM transactions o WHERE o.user = t.user AND o.id = t.id AND o.rid < t.rid)) {scope} ORDER BY rid""", params).fetchall()
+    next_ids = {}
+    for r in dupes:
+        if r['user'] not in next_ids: next_ids[r['user']] = reserve_ids(conn, r['user'])
+        conn.execute("UPDATE transactions SET id = ? WHERE rid = ?", (next_ids[r['user']], r['rid']))
+        next_ids[r['user']] += 1
+    conn.executemany("UPDATE users SET next_id = ? WHERE email = ?", [(n, user) for user, n in next_ids.items()])
+
+def _card_closing(conn, email):
+    return {r['name']: r['closing_day'] for r in conn.execute("SELECT name, closing_day FROM cards WHERE user = ?", (email,))}
+
+def _write_list(conn, table, fields, email, items):
+    conn.execute(f"DELETE FROM {table} WHERE user = ?", (email,))
+    cols = ", ".join(_q(c) for c in ['user', 'pos', *fields])
+    marks = ", ".join("?" * (len(fields) + 2))
+    conn.executemany(f"INSERT INTO {table} ({cols}) VALUES ({marks})",
+                     [(email, i, *[it.get(k) for k in fields]) for i, it in enumerate(items)])
+
+def _write_accounts(conn, email, accounts):
+    _write_list(conn, 'accounts', ['name'], email, [{"name": a} for a in accounts])
+
+def _recompute_comp(conn, email):
+    closing = _card_closing(conn, email)
+    rows = conn.execute('SELECT rid, date, type, account, status, amount, comp FROM transactions WHERE user = ?', (email,)).fetchall()
+    changed = [(k, r) for r in rows for k in [competence_key(dict(r), closing)] if k != r['comp']]
+    conn.executemany("UPDATE transactions SET comp = ? WHERE rid = ?", [(k, r['rid']) for k, r in changed])
+    # Só as linhas que mudaram de mês movem valores no índice mensal
+    deltas = totals_deltas(((r['comp'], r['type'], r['status'], r['amount']) for _, r in changed), -1)
+    totals_deltas(((k, r['type'], r['status'], r['amount']) for k, r in changed), 1, deltas)
+    if archive_years(email, conn):
+        from finsaas import archive  # só quem tem anos arquivados paga o import do pyarrow
+        archive.refresh_totals(conn, email, closing, deltas)
+    _apply_totals(conn, email, deltas)
+
+def _write_recurrences(conn, email, rules, overrides):
+    conn.execute("DELETE FROM recurrences WHERE user = ?", (email,))
+    conn.execute("DELETE FROM recurrence_overrides WHERE user = ?", (email,))
+    for table, fields, items in (('recurrences', RULE_FIELDS, rules), ('recurrence_overrides', OVERRIDE_FIELDS, overrides)):
+        cols = ", ".join(_q(c) for c in ['user', *fields])
+        conn.executemany(f"INSERT INTO {table} ({cols}) VALUES ({', '.join('?' * (len(fields) + 1))})",
+                         [(email, *[it.get(k) for k in fields]) for it in items])
+
+def _replace_user_data(conn, email, user_data):
+    cards = user_data.get('cards', [])
+    reserve_ids(conn, email)  # os ids das linhas substituídas continuam reservados
+    conn.execute("DELETE FROM transactions WHERE user = ?", (email,))
+    _insert_txs(conn, email, user_data.get('transactions', []), closing_days(cards), totals=False)
+    _rebuild_totals(conn, email)
+    _dedupe_ids(conn, email)
+    _write_list(conn, 'cards', CARD_FIELDS, email, cards)
+    _rebuild_invoices(conn, email)
+    _write_accounts(conn, email, user_data.get('accounts', []))
+    _write_list(conn, 'goals', GOAL_FIELDS, email, user_data.get('goals', []))
+    if 'recurrences' in user_data:
+        _write_recurrences(conn, email, user_data['recurrences'], user_data.get('recurrence_overrides', []))
+
+def mutation(fn):
+    """Escrita de um usuário: fn(conn, email, ...) roda numa transação própria.
+
+    A versão pública aceita expected_version (checagem otimista) e o corpo fica em
+    .apply para que o CommitQueue (finsaas/writer.py) agrupe várias escritas num só commit.
+    """
+    @functools.wraps(fn)
+    def public(email, *args, expected_version=None, **kwargs):
+        with span(f"storage.{fn.__name__}"), write_tx(email) as conn:
+            check_version(conn, email, expected_version)
+            return fn(conn, email, *args, **kwargs)
+    public.apply = fn
+    return public
+
+@mutation
+def save_user_data(conn, email, user_data):
+    # Substitui apenas as linhas deste usuário (os demais não são tocados)
+    _replace_user_data(conn, email, user_data)
+
+@mutation
+def apply_transaction_changes(conn, email, inserted=(), updated=(), deleted=()):
+    """Grava só o que mudou no Extrato: linhas novas, alteradas (casadas pelo 'id') e excluídas."""
+    inserted, updated, deleted = list(inserted), list(updated), [int(i) for i in deleted]
+    reserve_ids(conn, email)  # antes das exclusões: o id delas não volta nas inclusões
+    closing = _card_closing(conn, email)
+    touched = deleted + [int(tx['id']) for tx in updated]
+    old = [r for tid in touched
+           for r in conn.execute("SELECT comp, type, status, amount, account FROM transactions WHERE user = ? AND id = ?", (email, tid))]
+    deltas = totals_deltas((tuple(r)[:4] for r in old), -1)
+    invoices = _invoice_deltas(((r['account'], r['comp'], r['type'], r['amount']) for r in old), closing, -1)
+    conn.executemany("DELETE FROM transactions WHERE user = ? AND id = ?", [(email, tid) for tid in deleted])
+    fields = [k for k in TX_FIELDS if k != 'id']
+    sets = ", ".join(f"{_q(k)} = ?" for k in [*fields, 'comp'])
+    new_rows = [(*[tx.get(k) for k in fields], competence_key(tx, closing), email, int(tx['id'])) for tx in updated]
+    conn.executemany(f"UPDATE transactions SET {sets} WHERE user = ? AND id = ?", new_rows)
+    i_type, i_status, i_amount, i_account = (fields.index(k) for k in ('type', 'status', 'amount', 'account'))
+    totals_deltas(((r[-3], r[i_type], r[i_status], r[i_amount]) for r in new_rows), 1, deltas)
+    _invoice_deltas(((r[i_account], r[-3], r[i_type], r[i_amount]) for r in new_rows), closing, 1, invoices)
+    _apply_totals(conn, email, deltas)
+    _apply_invoices(conn, email, invoices)
+    _insert_txs(conn, email, _assign_ids(conn, email, inserted), closing)
+    return inserted
+
+@mutation
+def insert_transaction(conn, email, tx):
+    _insert_txs(conn, email, _assign_ids(conn, email, [tx]), _card_closing(conn, email))
+    return tx['id']
+
+@mutation
+def insert_transactions(conn, email, txs):
+    # Lote de importação: um único executemany e um ajuste por mês no índice mensal
+    txs = _assign_ids(conn, email, list(txs))
+    _insert_txs(conn, email, txs, _card_closing(conn, email))
+    return len(txs)
+
+@mutation
+def save_cards(conn, email, cards):
+    old = _card_closing(conn, email)
+    _write_list(conn, 'cards', CARD_FIELDS, email, cards)
+    _recompute_comp(conn, email)
+    # Limite e vencimento não mudam os totais; fechamento (ou cartão novo/removido) refaz as faturas
+    if _card_closing(conn, email) != old:
+        _rebuild_invoices(conn, email)
+
+@mutation
+def save_accounts(conn, email, accounts):
+    _write_accounts(conn, email, accounts)
+
+@mutation
+def save_goals(conn, email, goals):
+    _write_list(conn, 'goals', GOAL_FIELDS, email, goals)
+
+@mutation
+def add_goal_contribution(conn, email, tx, goal_name, amount):
+    # Aporte: lança a despesa e soma o valor na meta de forma atômica
+    _insert_txs(conn, email, _assign_ids(conn, email, [tx]), _card_closing(conn, email))
+    row = conn.execute("SELECT pos, current FROM goals WHERE user = ? AND name = ? ORDER BY pos LIMIT 1",
+                       (email, goal_name)).fetchone()
+    if row:
+        conn.execute("UPDATE goals SET current = ? WHERE user = ? AND pos = ?",
+                     (safe_float(row['current']) + amount, email, row['pos']))
+
+@mutation
+def save_recurrence(conn, email, rule):
+    """Cria ou atualiza uma regra (uma linha só, seja qual for o número de ocorrências). Devolve o id."""
+    rule = dict(rule)
+    if is_missing(rule.get('id')):
+        top = conn.execute("SELECT MAX(id) FROM recurrences WHERE user = ?", (email,)).fetchone()[0]
+        rule['id'] = (top or 0) + 1
+    cols = ", ".join(_q(c) for c in ['user', *RULE_FIELDS])
+    conn.execute(f"INSERT OR REPLACE INTO recurrences ({cols}) VALUES ({', '.join('?' * (len(RULE_FIELDS) + 1))})",
+                 (email, *[rule.get(k) for k in RULE_FIELDS]))
+    return rule['id']
+
+@mutation
+def delete_recurrence(conn, email, rule_id):
+    conn.execute("DELETE FROM recurrences WHERE user = ? AND id = ?", (email, rule_id))
+    conn.execute("DELETE FROM recurrence_overrides WHERE user = ? AND rule_id = ?", (email, rule_id))
+
+@mutation
+def set_occurrence(conn, email, rule_id, n, cancelled=False, **fields):
+    """Edita (date/amount/status/desc) ou cancela só a ocorrência n da regra, sem materializar a série."""
+    conn.execute("""INSERT OR REPLACE INTO recurrence_overrides (user, rule_id, n, cancelled, date, amount, status, "desc")
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", (email, rule_id, int(n), int(bool(cancelled)),
+                                             *[fields.get(k) for k in ('date', 'amount', 'status', 'desc')]))
+
+@mutation
+def reset_occurrence(conn, email, rule_id, n):
+    conn.execute("DELETE FROM recurrence_overrides WHERE user = ? AND rule_id = ? AND n = ?", (email, rule_id, int(n)))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Migra o banco JSON antigo para SQLite.")
+    parser.add_argument("json_path", nargs="?", default=LEGACY_JSON)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    set_db_path(args.db)
+    n_users, n_txs = migrate_json(args.json_path)
+    print(f"Migrados {n_users} usuários e {n_txs} transações para {args.db}")
@@ -0,0 +1,5 @@
+# --- FUNÇÕES UTILITÁRIAS ---
+def safe_float(val):
+    if val is None: return 0.0
+    try: return float(val)
+    except (ValueError, TypeError): return 0.0
@@ -0,0 +1,85 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from finsaas import storage
+
+# --- FILA DE GRAVAÇÃO (ESCRITOR ÚNICO) ---
+class CommitQueue:
+    """Uma thread escreve por todas as sessões.
+
+    As mutações (funções de storage decoradas com @mutation) entram numa fila; a
+    thread junta o que chegou em rajada e grava tudo num único BEGIN IMMEDIATE /
+    COMMIT. Cada mutação roda num SAVEPOINT, então um conflito de versão ou erro
+    desfaz só aquela mutação e é devolvido no Future de quem a enviou.
+    """
+
+    def __init__(self, db_path=None, max_batch=256, linger=0.0):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.linger = linger
+        self.batches = 0
+        self.committed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="finsaas-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, op, email, *args, expected_version=None, **kwargs):
+        fut = Future()
+        self._queue.put((op, email, args, kwargs, expected_version, fut))
+        return fut
+
+    def call(self, op, email, *args, **kwargs):
+        # Envia e espera o commit; relança ConflictError e erros da mutação
+        return self.submit(op, email, *args, **kwargs).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None: return None
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = storage.connect(self.db_path)
+        while True:
+            batch = self._next_batch()
+            if batch is None: break
+            outcomes = []
+            try:
+                with storage.write_tx(conn=conn):
+                    for op, email, args, kwargs, expected, fut in batch:
+                        conn.execute("SAVEPOINT mutation")
+                        try:
+                            storage.check_version(conn, email, expected)
+                            result = op.apply(conn, email, *args, **kwargs)
+                            storage.bump_version(conn, email)
+                            conn.execute("RELEASE mutation")
+                            outcomes.append((fut, result, None))
+                        except Exception as exc:
+                            conn.execute("ROLLBACK TO mutation")
+                            conn.execute("RELEASE mutation")
+                            outcomes.append((fut, None, exc))
+            except Exception as exc:
+                for *_, fut in batch: fut.set_exception(exc)
+                continue
+            # Só responde depois do COMMIT: quem espera o Future vê o dado já gravado
+            self.batches += 1
+            self.committed += len(batch)
+            for fut, result, exc in outcomes:
+                if exc is None: fut.set_result(result)
+                else: fut.set_exception(exc)
+        conn.close()